@@ -0,0 +1,187 @@
+import argparse
+import torch
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from inference import (load_model, infer_from_words, inference_batch, inference_seq2pos_batch,
+                       normalized_string, split_windows)
+from onnx_backend import OnnxModel
+from pose_decoder import PoseDecoder
+from smoothing import add_filter_args, filter_from_args, smooth_clip
+
+
+def load_sentences(path):
+    ''' one sentence per line, blank lines are skipped '''
+    with open(path, 'r') as f:
+        return [l.strip() for l in f if l.strip()]
+
+
+def _transformer_motions(model, word_list, sp_durations, opt, data, batch_size, n_workers):
+    # gather the windows of every sentence, remember which sentence they belong to
+    windows = []
+    owners = []
+    for s_i, (words, sp_duration) in enumerate(zip(word_list, sp_durations)):
+        sentence_windows, _ = split_windows(words, opt, sp_duration)
+        windows += sentence_windows
+        owners += [s_i] * len(sentence_windows)
+
+    # windows of a similar length share a batch to keep padding small
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+    chunks = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+    def run(chunk):
+        with torch.no_grad():
+            return inference_batch(model, [windows[i] for i in chunk], opt, data)
+
+    motions = [None] * len(windows)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for chunk, outputs in zip(chunks, executor.map(run, chunks)):
+            for i, output in zip(chunk, outputs):
+                motions[i] = output
+
+    per_sentence = [[] for _ in word_list]
+    for owner, motion in zip(owners, motions):
+        per_sentence[owner].append(motion)
+    return per_sentence
+
+
+def _seq2pos_motions(model, word_list, sp_durations, opt, data, batch_size, n_workers):
+    # the k-th windows of all utterances only depend on their own (k-1)-th window,
+    # so they are decoded together
+    sentence_windows = [split_windows(words, opt, sp_duration)[0]
+                        for words, sp_duration in zip(word_list, sp_durations)]
+    pre_motions = [np.zeros((30, data['pca'].n_components)) for _ in word_list]
+    per_sentence = [[] for _ in word_list]
+
+    def run(chunk):
+        with torch.no_grad():
+            return inference_seq2pos_batch(model,
+                                           [sentence_windows[s_i][k] for s_i, k in chunk],
+                                           [pre_motions[s_i] for s_i, _ in chunk],
+                                           opt, data)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for k in range(max(len(w) for w in sentence_windows)):
+            active = [(s_i, k) for s_i, windows in enumerate(sentence_windows) if k < len(windows)]
+            chunks = [active[i:i + batch_size] for i in range(0, len(active), batch_size)]
+            for chunk, outputs in zip(chunks, executor.map(run, chunks)):
+                for (s_i, _), output in zip(chunk, outputs):
+                    per_sentence[s_i].append(output)
+                    pre_motions[s_i] = output
+    return per_sentence
+
+
+def _sequential_motions(model, word_list, sp_durations, opt, data, n_workers):
+    # windows of one utterance depend on each other, utterances run in parallel
+    def run(words, sp_duration):
+        return [out.out_motion for out in infer_from_words(model, words, opt, data, sp_duration)]
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(run, word_list, sp_durations))
+
+
+def infer_word_lists(model, word_list, opt, data, batch_size=64, n_workers=1, sp_durations=None):
+    '''
+    pca motion of many tokenized utterances
+
+    param:
+        word_list - list of word lists, none of them empty
+        sp_durations - optional speech duration in seconds per utterance
+    return:
+        list of pca motion arrays [frames x dim]
+    '''
+    if sp_durations is None:
+        sp_durations = [None] * len(word_list)
+    if len(word_list) == 0:
+        return []
+
+    if opt.model == 'transformer':
+        motions = _transformer_motions(model, word_list, sp_durations, opt, data, batch_size, n_workers)
+    elif not isinstance(model, OnnxModel):
+        motions = _seq2pos_motions(model, word_list, sp_durations, opt, data, batch_size, n_workers)
+    else:
+        motions = _sequential_motions(model, word_list, sp_durations, opt, data, n_workers)
+
+    n_components = data['pca'].n_components
+    return [np.concatenate([np.asarray(m).reshape(-1, n_components) for m in windows])
+            for windows in motions]
+
+
+def infer_sentences(model, sentences, opt, data, batch_size=64, n_workers=1, decode=True, smoother=None):
+    '''
+    generate gestures for many sentences at once
+
+    param:
+        model - loaded model (torch or onnx backend)
+        sentences - list of raw sentences
+        opt - model settings from the checkpoint
+        data - preprocessed data with 'dict' and 'pca'
+        batch_size - number of word windows per forward pass
+        n_workers - number of threads running forward passes
+        decode - convert pca motion into skeleton poses
+        smoother - optional filter (smoothing.py) of the decoded joints,
+                   reset for every sentence
+    return:
+        list of pose arrays, one [frames x 24] (or [frames x pca dim]) per sentence
+    '''
+    if smoother is not None and not decode:
+        raise ValueError('smoothing is applied to the decoded joints, use decode=True')
+
+    word_list = [normalized_string(sentence).split(' ') for sentence in sentences]
+    valid = [i for i, words in enumerate(word_list) if words != ['']]
+    word_list = [word_list[i] for i in valid]
+
+    motions = infer_word_lists(model, word_list, opt, data, batch_size, n_workers)
+
+    n_components = data['pca'].n_components
+    results = [np.zeros((0, 24 if decode else n_components)) for _ in sentences]
+    for i, motion in zip(valid, motions):
+        results[i] = motion
+
+    if decode and len(valid) > 0:
+        # decode the frames of all sentences at once and split them again
+        lengths = [len(results[i]) for i in valid]
+        poses = PoseDecoder.from_pca(data['pca']).decode(np.concatenate([results[i] for i in valid]))
+        for i, pose in zip(valid, np.split(poses, np.cumsum(lengths)[:-1])):
+            results[i] = smooth_clip(smoother, pose)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    parser.add_argument('-checkpoint', default='./trained_model/transformer.chkpt')
+    parser.add_argument('-sentences', default='./data/sentences.txt')
+    parser.add_argument('-save', default='./videos/poses.pickle')
+    parser.add_argument('-batch_size', type=int, default=64)
+    parser.add_argument('-n_workers', type=int, default=1)
+    parser.add_argument('-n_threads', type=int, default=0)
+    add_filter_args(parser)
+
+    arg = parser.parse_args()
+
+    if arg.n_threads > 0:
+        torch.set_num_threads(arg.n_threads)
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    data = torch.load(arg.data)
+    model_info = torch.load(arg.checkpoint)
+    opt = model_info['settings']
+    model = load_model(model_info, data, device)
+
+    sentences = load_sentences(arg.sentences)
+    print('[INFO] sentences: {}'.format(len(sentences)))
+
+    poses = infer_sentences(model, sentences, opt, data,
+                            batch_size=arg.batch_size, n_workers=arg.n_workers,
+                            smoother=filter_from_args(arg))
+    print('[INFO] generated pose frames: {}'.format(sum(len(p) for p in poses)))
+
+    torch.save({'sentences': sentences, 'poses': poses}, arg.save)
+    print('[INFO] poses saved: {}'.format(arg.save))
+
+
+if __name__ == '__main__':
+    main()
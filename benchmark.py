@@ -0,0 +1,251 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import torch
+import numpy as np
+
+from argparse import Namespace
+from bundle import PCAParams
+from inference import infer_from_words, inference_batch, inference_seq2pos_batch, split_windows
+from quantize import quantize_model
+from train import build_model
+
+import constant as Constant
+
+
+def synthetic_data(n_vocab=2000, emb_dim=300, n_components=10, seed=0):
+    '''
+    random vocabulary, embedding and pca, no dataset needed
+
+    note:
+        the word order of the vocabulary is fixed by the seed,
+        so sentences of the same length are the same between runs
+    '''
+    rng = np.random.RandomState(seed)
+    word2idx = {Constant.PAD_WORD: Constant.PAD, Constant.UNK_WORD: Constant.UNK,
+                Constant.BOS_WORD: Constant.BOS, Constant.EOS_WORD: Constant.EOS}
+    for i in range(n_vocab - len(word2idx)):
+        word2idx['w{}'.format(i)] = len(word2idx)
+
+    # orthonormal components like a fitted pca
+    components = np.linalg.qr(rng.normal(size=(24, n_components)))[0].T
+    return {
+        'dict': word2idx,
+        'emb_tbl': rng.normal(size=(len(word2idx), emb_dim)),
+        'pca': PCAParams(components, rng.normal(size=24))
+    }
+
+
+def synthetic_settings(model_name, data):
+    ''' default model settings of train.py '''
+    n_components = data['pca'].n_components
+    return Namespace(model=model_name, batch_size=1, dropout=0.1,
+                     pre_motions=10, estimation_motions=20,
+                     hidden_size=200, bidirectional=True, n_enc_layers=2, n_dec_layers=1,
+                     n_layers=4, d_enc_model=data['emb_tbl'].shape[1], d_dec_model=n_components,
+                     d_inner_hid=1024, d_k=50, d_v=50, n_head=6, n_position=10,
+                     src_pad_idx=Constant.PAD, trg_pad_idx=torch.zeros(n_components),
+                     scr_vocab_size=len(data['dict']))
+
+
+def random_model(opt, data, precision):
+    torch.manual_seed(0)
+    model = build_model(opt, data, torch.device('cpu'))
+    model.eval()
+    if precision == 'int8':
+        model = quantize_model(model)
+    return model
+
+
+def random_sentence(data, length, seed=0):
+    rng = np.random.RandomState(seed)
+    words = [w for w in data['dict'] if w.startswith('w')]
+    return [words[i] for i in rng.randint(0, len(words), length)]
+
+
+def measure(fn, n_items, repeats, warmup):
+    '''
+    time repeated calls of fn
+
+    return:
+        latency percentiles in ms, throughput in items per second
+    '''
+    with torch.no_grad():
+        for _ in range(warmup):
+            fn()
+        latency = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            latency.append(time.perf_counter() - start)
+
+    latency = np.array(latency)
+    return {
+        'p50_ms': float(np.percentile(latency, 50) * 1000),
+        'p95_ms': float(np.percentile(latency, 95) * 1000),
+        'p99_ms': float(np.percentile(latency, 99) * 1000),
+        'throughput': float(n_items * repeats / latency.sum())
+    }
+
+
+def _proc_status_mb(field):
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def reset_peak_rss():
+    '''
+    start a new peak memory measurement and return the current resident memory (MB)
+
+    note:
+        linux only (/proc/self/clear_refs resets VmHWM), None elsewhere.
+        ru_maxrss cannot be reset, every case after the largest one would report its peak
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _proc_status_mb('VmRSS')
+    except OSError:
+        return None
+
+
+def case_peak_rss_mb():
+    ''' peak resident memory since the last reset_peak_rss '''
+    try:
+        return _proc_status_mb('VmHWM')
+    except OSError:
+        return None
+
+
+def forward_windows(model, opt, data, batch_size):
+    ''' batch of word windows the size the models are trained on '''
+    windows, _ = split_windows(random_sentence(data, 64), opt)
+    windows = (windows * batch_size)[:batch_size]
+
+    if opt.model == 'transformer':
+        return lambda: inference_batch(model, windows, opt, data)
+
+    pre_motions = [np.zeros((opt.pre_motions, data['pca'].n_components))] * batch_size
+    return lambda: inference_seq2pos_batch(model, windows, pre_motions, opt, data)
+
+
+def run_benchmarks(arg):
+    '''
+    every combination of model, precision and thread count is run
+    for each sentence length (infer_from_words, words per second)
+    and each batch size (single forward pass, windows per second)
+    '''
+    data = synthetic_data(arg.vocab_size)
+    results = []
+
+    for model_name in arg.models:
+        opt = synthetic_settings(model_name, data)
+        for precision in arg.precisions:
+            model = random_model(opt, data, precision)
+            for n_threads in arg.threads:
+                torch.set_num_threads(n_threads)
+                cases = [('words', length, 1, length,
+                          lambda words=random_sentence(data, length): infer_from_words(model, words, opt, data))
+                         for length in arg.lengths]
+                cases += [('forward', 0, batch_size, batch_size,
+                           forward_windows(model, opt, data, batch_size))
+                          for batch_size in arg.batch_sizes]
+
+                for kind, length, batch_size, n_items, fn in cases:
+                    result = {
+                        'name': '{}/{}/{}/t{}/l{}/b{}'.format(model_name, kind, precision,
+                                                              n_threads, length, batch_size),
+                        'model': model_name,
+                        'kind': kind,
+                        'precision': precision,
+                        'threads': n_threads,
+                        'length': length,
+                        'batch_size': batch_size
+                    }
+                    rss_before = reset_peak_rss()
+                    result.update(measure(fn, n_items, arg.repeats, arg.warmup))
+                    # peak of the process while the case ran, and how much the case added on top
+                    peak = case_peak_rss_mb() if rss_before is not None else None
+                    result['case_peak_rss_mb'] = peak
+                    result['case_rss_delta_mb'] = peak - rss_before if peak is not None else None
+                    results.append(result)
+                    print('[INFO] {:40s} p50 {:8.2f}ms  p95 {:8.2f}ms  p99 {:8.2f}ms  {:10.1f}/s  rss {}'.format(
+                        result['name'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                        result['throughput'], '-' if peak is None else
+                        '{:.0f}MB ({:+.1f}MB)'.format(peak, result['case_rss_delta_mb'])))
+
+    return {
+        'meta': {
+            'torch': torch.__version__,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'vocab_size': arg.vocab_size,
+            'repeats': arg.repeats
+        },
+        'results': results
+    }
+
+
+def compare_baseline(report, baseline, tolerance):
+    '''
+    compare p50 latency and throughput with a stored report
+
+    return:
+        names of the benchmarks that got slower than the tolerance allows
+    '''
+    base = {r['name']: r for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        if result['name'] not in base:
+            continue
+        ref = base[result['name']]
+        latency_ratio = result['p50_ms'] / ref['p50_ms']
+        throughput_ratio = result['throughput'] / ref['throughput']
+        slower = latency_ratio > 1 + tolerance or throughput_ratio < 1 - tolerance
+        if slower:
+            regressions.append(result['name'])
+        print('[INFO] {:40s} p50 x{:.2f}  throughput x{:.2f}{}'.format(
+            result['name'], latency_ratio, throughput_ratio, '  REGRESSION' if slower else ''))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-models', nargs='+', default=['transformer', 'seq2pos'])
+    parser.add_argument('-lengths', nargs='+', type=int, default=[8, 32, 128]) # words per sentence
+    parser.add_argument('-batch_sizes', nargs='+', type=int, default=[1, 8, 32]) # windows per forward
+    parser.add_argument('-threads', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('-precisions', nargs='+', default=['fp32', 'int8'])
+    parser.add_argument('-vocab_size', type=int, default=2000)
+    parser.add_argument('-repeats', type=int, default=20)
+    parser.add_argument('-warmup', type=int, default=3)
+    parser.add_argument('-save', default='./benchmark.json')
+    parser.add_argument('-baseline', default=None)
+    parser.add_argument('-tolerance', type=float, default=0.1) # allowed slow down against the baseline
+
+    arg = parser.parse_args()
+
+    report = run_benchmarks(arg)
+    with open(arg.save, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('[INFO] benchmark saved: {}'.format(arg.save))
+
+    if arg.baseline:
+        with open(arg.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(report, baseline, arg.tolerance)
+        if regressions:
+            print('[INFO] {} benchmarks slower than the baseline'.format(len(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
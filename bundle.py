@@ -0,0 +1,137 @@
+import argparse
+import time
+import torch
+import numpy as np
+
+from argparse import Namespace
+from inference import load_model
+from embedding import EMB_KEYS, EMB_DTYPES, compact_emb_table, strip_embedding
+
+
+class PCAParams():
+    ''' inverse / forward pca transform from plain arrays, no sklearn needed '''
+
+    def __init__(self, components, mean, explained_variance=None, whiten=False):
+        self.components_ = np.asarray(components)
+        self.mean_ = np.asarray(mean)
+        self.explained_variance_ = explained_variance
+        self.whiten = whiten
+        self.n_components = self.components_.shape[0]
+
+    @classmethod
+    def from_sklearn(cls, pca):
+        return cls(pca.components_, pca.mean_, pca.explained_variance_, pca.whiten)
+
+    def state(self):
+        return {
+            'components': self.components_,
+            'mean': self.mean_,
+            'explained_variance': self.explained_variance_,
+            'whiten': self.whiten
+        }
+
+    def transform(self, X):
+        X = np.asarray(X) - self.mean_
+        X_transformed = X @ self.components_.T
+        if self.whiten:
+            X_transformed /= np.sqrt(self.explained_variance_)
+        return X_transformed
+
+    def inverse_transform(self, X):
+        X = np.asarray(X)
+        if self.whiten:
+            X = X * np.sqrt(self.explained_variance_)
+        return X @ self.components_ + self.mean_
+
+
+def export_bundle(data, model_info, path, emb_dtype='float16'):
+    '''
+    write everything the inference needs into a single file
+
+    note:
+        train and valid instances of the data file are left out
+    '''
+    # the checkpoint holds the embedding the model was trained with, if it has one
+    state = model_info['model']
+    emb_tbl = next((state[k] for k in EMB_KEYS if k in state), data['emb_tbl'])
+    if isinstance(emb_tbl, torch.Tensor):
+        emb_tbl = emb_tbl.to(EMB_DTYPES[emb_dtype])
+    else:
+        emb_tbl = compact_emb_table(emb_tbl, emb_dtype)
+
+    bundle = {
+        'dict': data['dict'],
+        'emb_tbl': emb_tbl,
+        'pca': PCAParams.from_sklearn(data['pca']).state(),
+        'settings': vars(model_info['settings']),
+        'model': strip_embedding(state),
+        'quantized': model_info.get('quantized', False),
+        'shared_emb': True
+    }
+    torch.save(bundle, path)
+    print('[INFO] inference bundle saved: {}'.format(path))
+
+
+def load_bundle(path, device=torch.device('cpu'), quantize=False):
+    '''
+    load an inference bundle
+
+    param:
+        quantize - apply dynamic int8 quantization unless the bundled model already is
+    note:
+        tensors are memory mapped where torch supports it,
+        the embedding table is shared with the file instead of copied.
+        the bundle holds numpy pca arrays and the settings, so it is not a
+        weights only file (default of torch.load since torch 2.6)
+    return:
+        model, settings, data dictionary with 'dict', 'emb_tbl' and 'pca'
+    '''
+    try:
+        bundle = torch.load(path, map_location='cpu', mmap=True, weights_only=False)
+    except TypeError:
+        # older torch without mmap / weights_only support
+        bundle = torch.load(path, map_location='cpu')
+
+    opt = Namespace(**bundle['settings'])
+    data = {
+        'dict': bundle['dict'],
+        'emb_tbl': bundle['emb_tbl'],
+        'pca': PCAParams(**bundle['pca'])
+    }
+    model_info = {
+        'model': bundle['model'],
+        'settings': opt,
+        'quantized': bundle['quantized'],
+        'shared_emb': bundle['shared_emb']
+    }
+    model = load_model(model_info, data, device)
+
+    if quantize and not bundle['quantized']:
+        from quantize import quantize_model
+        print('[INFO] Apply dynamic int8 quantization.')
+        model = quantize_model(model)
+
+    return model, opt, data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    parser.add_argument('-checkpoint', default='./trained_model/transformer.chkpt')
+    parser.add_argument('-save', default='./trained_model/transformer.bundle')
+    parser.add_argument('-emb_dtype', default='float16', choices=list(EMB_DTYPES))
+
+    arg = parser.parse_args()
+
+    data = torch.load(arg.data)
+    model_info = torch.load(arg.checkpoint, map_location='cpu')
+    export_bundle(data, model_info, arg.save, arg.emb_dtype)
+
+    start = time.time()
+    load_bundle(arg.save)
+    print('[INFO] bundle load time: {:.3f}s'.format(time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
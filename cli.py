@@ -0,0 +1,10 @@
+import argparse
+
+
+def str2bool(value):
+    # type=bool would turn '-flag False' into True
+    if value.lower() in ('true', 'yes', '1'):
+        return True
+    if value.lower() in ('false', 'no', '0'):
+        return False
+    raise argparse.ArgumentTypeError('expected true or false: {}'.format(value))
@@ -0,0 +1,104 @@
+import argparse
+import os
+import random
+import textwrap
+import torch
+import numpy as np
+
+from inference import load_model, infer_from_words
+from pose_decoder import PoseDecoder
+from render import render_many
+from smoothing import add_filter_args, filter_from_args, smooth_clip
+
+import constant as Constant
+
+
+def clip_words(src, idx2word):
+    # the dataset instances have no SOS / EOS
+    return [idx2word.get(idx, Constant.UNK_WORD) for idx in src]
+
+
+def predict_poses(model, opt, words, n_frames, data, pose_decoder, smoother):
+    '''
+    motion of one clip, windows are timed to the length of the ground truth
+
+    note:
+        window k lines up with the ground truth frames
+        [k * estimation_motions, (k + 1) * estimation_motions)
+    '''
+    outputs = infer_from_words(model, words, opt, data, sp_duration=n_frames / 12)
+    motion = np.concatenate([np.asarray(out.out_motion) for out in outputs])
+    return smooth_clip(smoother, pose_decoder.decode(motion[:n_frames]))
+
+
+def stack_panels(panels):
+    '''
+    [frames x 24] per panel -> [frames x panels x 24]
+
+    note:
+        shorter panels are padded with nan, the renderer leaves them empty
+    '''
+    n_frames = max(len(p) for p in panels)
+    grid = np.full((n_frames, len(panels), panels[0].shape[1]), np.nan)
+    for i, p in enumerate(panels):
+        grid[:len(p), i] = p
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    parser.add_argument('-seq2pos', default='./trained_model/seq2pos.chkpt')
+    parser.add_argument('-transformer', default='./trained_model/transformer.chkpt')
+    parser.add_argument('-indices', nargs='+', type=int, default=None) # validation clips
+    parser.add_argument('-n_clips', type=int, default=10) # random clips when no -indices are given
+    parser.add_argument('-seed', type=int, default=0)
+    parser.add_argument('-save_dir', default='./videos/compare/')
+    parser.add_argument('-n_workers', type=int, default=0) # 0: one per core
+    add_filter_args(parser)
+
+    arg = parser.parse_args()
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    data = torch.load(arg.data)
+    valid = data['valid']
+    idx2word = {idx: word for word, idx in data['dict'].items()}
+    pose_decoder = PoseDecoder.from_pca(data['pca'])
+    smoother = filter_from_args(arg)
+
+    # models are loaded once and shared by every clip
+    models = []
+    for name, path in (('seq2pos', arg.seq2pos), ('transformer', arg.transformer)):
+        if path:
+            model_info = torch.load(path)
+            models.append((name, load_model(model_info, data, device), model_info['settings']))
+
+    indices = arg.indices
+    if indices is None:
+        indices = random.Random(arg.seed).sample(range(len(valid['src'])), min(arg.n_clips, len(valid['src'])))
+
+    os.makedirs(arg.save_dir, exist_ok=True)
+    clips, names, configs = [], [], []
+    for index in indices:
+        words = clip_words(valid['src'][index], idx2word)
+        ground_truth = pose_decoder.decode(valid['tgt'][index])
+        panels = [smooth_clip(smoother, ground_truth)]
+        with torch.no_grad():
+            for _, model, opt in models:
+                panels.append(predict_poses(model, opt, words, len(ground_truth), data, pose_decoder, smoother))
+
+        clips.append(stack_panels(panels))
+        names.append(os.path.join(arg.save_dir, 'valid_{:05d}.mp4'.format(index)))
+        configs.append({
+            'titles': ['ground truth'] + [name for name, _, _ in models],
+            'caption': textwrap.fill(' '.join(words), 120),
+            'figsize': (4.8 * len(panels), 5.6)
+        })
+        print('[INFO] clip {}: {} words, {} frames'.format(index, len(words), len(clips[-1])))
+
+    render_many(clips, names, arg.n_workers or None, configs=configs)
+
+
+if __name__ == '__main__':
+    main()
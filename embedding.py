@@ -0,0 +1,90 @@
+import copy
+import numpy as np
+import torch
+
+import constant as Constants
+
+# state dict keys of the frozen word embedding in each model
+EMB_KEYS = ['encoder.src_word_emb.weight', 'encoder.embedding.weight']
+
+EMB_DTYPES = {
+    'float64': torch.float64,
+    'float32': torch.float32,
+    'float16': torch.float16,
+    'bfloat16': torch.bfloat16,
+}
+
+
+def emb_tensor(emb_matrix):
+    '''
+    convert an embedding table from the data file into a tensor for nn.Embedding
+
+    note:
+        float64 tables (default output of build_emb_table) become float32 as before,
+        compact float16 / bfloat16 tables keep their dtype
+    '''
+    if isinstance(emb_matrix, np.ndarray):
+        emb_matrix = torch.from_numpy(emb_matrix)
+    if emb_matrix.dtype == torch.float64:
+        emb_matrix = emb_matrix.float()
+    return emb_matrix
+
+
+def compact_emb_table(emb_tb, dtype):
+    ''' store the frozen embedding table with a smaller float type '''
+    return torch.from_numpy(np.asarray(emb_tb)).to(EMB_DTYPES[dtype])
+
+
+def prune_vocab(word2idx, emb_tb, insts_list, drop_words=()):
+    '''
+    drop vocabulary rows, the dropped words become UNK in the instances
+
+    param:
+        word2idx - word to index dictionary
+        emb_tb - embedding table indexed by word2idx
+        insts_list - list of index sequence instances (e.g. [train_src, valid_src])
+        drop_words - words to map to UNK, e.g. the words without a pretrained
+                     vector (build_emb_table), their rows are only random noise
+    return:
+        pruned word2idx, pruned embedding table, remapped insts_list
+    note:
+        rows which no instance uses are dropped as well
+    '''
+    drop_idx = set(word2idx[w] for w in drop_words if w in word2idx)
+    # special tokens always keep their fixed index
+    specials = [Constants.PAD, Constants.UNK, Constants.BOS, Constants.EOS]
+    drop_idx.difference_update(specials)
+
+    used = set(idx for insts in insts_list for inst in insts for idx in inst)
+    used.difference_update(drop_idx)
+    used.update(specials)
+
+    old_idx = sorted(used)
+    remap = {old: new for new, old in enumerate(old_idx)}
+    remap.update({old: Constants.UNK for old in drop_idx})
+    new_word2idx = {w: remap[i] for w, i in word2idx.items() if i in used}
+    new_emb_tb = emb_tb[old_idx]
+    new_insts_list = [[[remap[idx] for idx in inst] for inst in insts] for insts in insts_list]
+
+    print('[INFO] Pruned vocabulary size: {} -> {}'.format(len(word2idx), len(new_word2idx)))
+
+    return new_word2idx, new_emb_tb, new_insts_list
+
+
+def strip_embedding(state):
+    ''' remove the frozen embedding from a state dict, it is shared with the data file '''
+    # shallow copy keeps the state dict metadata (module versions)
+    state = copy.copy(state)
+    for k in EMB_KEYS:
+        state.pop(k, None)
+    return state
+
+
+def fill_embedding(state, model):
+    ''' put back the embedding built from the data file into a stripped state dict '''
+    model_state = model.state_dict()
+    state = copy.copy(state)
+    for k in EMB_KEYS:
+        if k in model_state and k not in state:
+            state[k] = model_state[k]
+    return state
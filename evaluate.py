@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import time
+import torch
+import numpy as np
+
+from batch_inference import infer_word_lists
+from inference import load_model
+from pose_decoder import PoseDecoder
+from retrieval import MotionIndex
+
+import constant as Constant
+
+
+def pad_clips(clips):
+    ''' list of [frames x dim] -> [clips x max frames x dim], padded with nan '''
+    n_frames = max(len(c) for c in clips)
+    out = np.full((len(clips), n_frames, clips[0].shape[1]), np.nan)
+    for i, c in enumerate(clips):
+        out[i, :len(c)] = c
+    return out
+
+
+def joint_norm(x):
+    ''' [..., 24] -> [..., 8] euclidean length per joint '''
+    return np.linalg.norm(x.reshape(x.shape[:-1] + (-1, 3)), axis=-1)
+
+
+def frechet_distance(x, y):
+    '''
+    frechet distance between gaussians fitted to two sets of frames [N x dim]
+
+    note:
+        tr(sqrt(S1 S2)) is the sum of the square roots of the eigenvalues of S1 S2
+    '''
+    mu_x, mu_y = x.mean(0), y.mean(0)
+    # np.cov of a single column is a scalar
+    cov_x, cov_y = np.atleast_2d(np.cov(x, rowvar=False)), np.atleast_2d(np.cov(y, rowvar=False))
+    eigvals = np.linalg.eigvals(cov_x @ cov_y)
+    tr_sqrt = np.sqrt(np.clip(eigvals.real, 0, None)).sum()
+    return float(((mu_x - mu_y) ** 2).sum() + np.trace(cov_x) + np.trace(cov_y) - 2 * tr_sqrt)
+
+
+def diversity(motion):
+    '''
+    mean distance between the clips
+
+    note:
+        a clip is described by the mean and standard deviation of its pca
+        coefficients, distances of all pairs come from one matmul
+    '''
+    feat = np.concatenate((np.nanmean(motion, axis=1), np.nanstd(motion, axis=1)), axis=1)
+    sq = (feat ** 2).sum(1)
+    dist = np.sqrt(np.clip(sq[:, np.newaxis] + sq[np.newaxis] - 2 * feat @ feat.T, 0, None))
+    n = len(feat)
+    return float(dist.sum() / (n * (n - 1))) if n > 1 else 0.0
+
+
+def motion_metrics(pred_motion, gt_motion, pose_decoder):
+    '''
+    compare predicted and ground truth motion of many clips at once
+
+    param:
+        pred_motion, gt_motion - lists of pca motion [frames x dim], clip by clip,
+                                 both are cut to the shorter one
+    return:
+        dictionary of metrics, *_gt entries are the same statistic of the ground truth
+    '''
+    lengths = [min(len(p), len(g)) for p, g in zip(pred_motion, gt_motion)]
+    pred = pad_clips([np.asarray(p[:n], dtype=np.float64) for p, n in zip(pred_motion, lengths)])
+    gt = pad_clips([np.asarray(g[:n], dtype=np.float64) for g, n in zip(gt_motion, lengths)])
+
+    # joint positions, nan padding stays nan through the linear decoder
+    pred_pose = pose_decoder.decode(pred).astype(np.float64)
+    gt_pose = pose_decoder.decode(gt).astype(np.float64)
+
+    pred_vel, gt_vel = np.diff(pred_pose, axis=1), np.diff(gt_pose, axis=1)
+    pred_acc, gt_acc = np.diff(pred_vel, axis=1), np.diff(gt_vel, axis=1)
+    pred_jerk, gt_jerk = np.diff(pred_acc, axis=1), np.diff(gt_acc, axis=1)
+
+    valid = ~np.isnan(pred).any(-1)
+    return {
+        'clips': len(lengths),
+        'frames': int(valid.sum()),
+        'joint_mse': float(np.nanmean((pred_pose - gt_pose) ** 2)),
+        'velocity_error': float(np.nanmean(joint_norm(pred_vel - gt_vel))),
+        'acceleration_error': float(np.nanmean(joint_norm(pred_acc - gt_acc))),
+        'jerk': float(np.nanmean(joint_norm(pred_jerk))),
+        'jerk_gt': float(np.nanmean(joint_norm(gt_jerk))),
+        'variance': float(np.nanmean(np.nanvar(pred_pose, axis=1))),
+        'variance_gt': float(np.nanmean(np.nanvar(gt_pose, axis=1))),
+        'diversity': diversity(pred),
+        'diversity_gt': diversity(gt),
+        'fd_pca': frechet_distance(pred[valid], gt[valid])
+    }
+
+
+def validation_clips(data, max_clips=None):
+    ''' return: word lists, ground truth pca motion and speech durations of the validation clips '''
+    idx2word = {idx: word for word, idx in data['dict'].items()}
+    src, tgt = data['valid']['src'], data['valid']['tgt']
+    if max_clips:
+        src, tgt = src[:max_clips], tgt[:max_clips]
+    word_list = [[idx2word.get(idx, Constant.UNK_WORD) for idx in s] for s in src]
+    # windows are timed to the ground truth (12 fps)
+    sp_durations = [len(t) / 12 for t in tgt]
+    return word_list, tgt, sp_durations
+
+
+def evaluate_checkpoint(path, data, device, batch_size, n_workers, max_clips=None):
+    model_info = torch.load(path, map_location=device)
+    opt = model_info['settings']
+    model = load_model(model_info, data, device)
+    word_list, tgt, sp_durations = validation_clips(data, max_clips)
+
+    start = time.time()
+    with torch.no_grad():
+        pred = infer_word_lists(model, word_list, opt, data, batch_size, n_workers, sp_durations)
+    elapse = time.time() - start
+
+    metrics = motion_metrics(pred, tgt, PoseDecoder.from_pca(data['pca']))
+    metrics.update({'checkpoint': path, 'model': opt.model, 'epoch': model_info.get('epoch'),
+                    'inference_sec': elapse})
+    return metrics
+
+
+def evaluate_retrieval(path, data, k=5, max_clips=None):
+    ''' the same metrics for the nearest neighbour baseline of retrieval.py '''
+    index = MotionIndex.load(path, data)
+    word_list, tgt, sp_durations = validation_clips(data, max_clips)
+
+    start = time.time()
+    pred = [index.generate(words, sp_duration, k) for words, sp_duration in zip(word_list, sp_durations)]
+    elapse = time.time() - start
+
+    metrics = motion_metrics(pred, tgt, PoseDecoder.from_pca(data['pca']))
+    metrics.update({'checkpoint': path, 'model': 'retrieval', 'epoch': None, 'inference_sec': elapse})
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    parser.add_argument('-checkpoints', nargs='+',
+                        default=['./trained_model/seq2pos.chkpt', './trained_model/transformer.chkpt'])
+    parser.add_argument('-retrieval', default=None) # retrieval index as a baseline, see retrieval.py
+    parser.add_argument('-k', type=int, default=5) # candidates per window of the retrieval baseline
+    parser.add_argument('-batch_size', type=int, default=256) # word windows per forward
+    parser.add_argument('-n_workers', type=int, default=1)
+    parser.add_argument('-max_clips', type=int, default=0) # 0: whole validation split
+    parser.add_argument('-save', default='./log/evaluation.json')
+
+    arg = parser.parse_args()
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    data = torch.load(arg.data)
+
+    results = []
+    for path in arg.checkpoints:
+        print('[INFO] evaluate: {}'.format(path))
+        results.append(evaluate_checkpoint(path, data, device, arg.batch_size, arg.n_workers, arg.max_clips))
+    if arg.retrieval:
+        print('[INFO] evaluate: {}'.format(arg.retrieval))
+        results.append(evaluate_retrieval(arg.retrieval, data, arg.k, arg.max_clips))
+
+    keys = ['joint_mse', 'velocity_error', 'acceleration_error', 'jerk', 'variance', 'diversity', 'fd_pca']
+    print('{:40s} {:>8s} '.format('checkpoint', 'model') + ' '.join('{:>12s}'.format(k) for k in keys))
+    for r in results:
+        print('{:40s} {:>8s} '.format(os.path.basename(r['checkpoint']), r['model']) +
+              ' '.join('{:12.5f}'.format(r[k]) for k in keys))
+    print('{:40s} {:>8s} '.format('ground truth', '') + ' '.join(
+        '{:12.5f}'.format(results[0][k + '_gt']) if k + '_gt' in results[0] else '{:>12s}'.format('-')
+        for k in keys))
+
+    with open(arg.save, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('[INFO] evaluation saved: {}'.format(arg.save))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import inspect
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+
+from cli import str2bool
+from inference import load_model
+from transformer.models import get_pad_mask
+from pose_decoder import PoseDecoder
+
+
+class TransformerGraph(nn.Module):
+    '''
+    encoder + pad_linear + decoder as a single graph
+
+    note:
+        with a pose decoder the skeleton poses are a second output
+    '''
+
+    def __init__(self, model, pose_decoder=None):
+        super().__init__()
+        self.model = model
+        self.pose_decoder = pose_decoder
+
+    def forward(self, src_seq, trg_seq):
+        src_mask = get_pad_mask(src_seq, self.model.src_pad_idx)
+        enc_output, *_ = self.model.encoder(src_seq, src_mask)
+        enc_output = self.model.pad_linear(enc_output)
+        dec_output, *_ = self.model.decoder(trg_seq, None, enc_output, src_mask)
+        if self.pose_decoder is not None:
+            return dec_output, self.pose_decoder(dec_output)
+        return dec_output
+
+
+class Seq2PoseEncoderGraph(nn.Module):
+    '''
+    seq2pos encoder without sequence packing
+
+    note:
+        packing is not exportable, every sequence in a batch must have the same length
+    '''
+
+    def __init__(self, encoder):
+        super().__init__()
+        self.encoder = encoder
+
+    def forward(self, src_seq):
+        embedded = self.encoder.embedding(src_seq).float()
+        output, hidden = self.encoder.gru(embedded)
+        if self.encoder.bidirectional:
+            output = output[:,:,:self.encoder.hidden_size] + output[:,:,self.encoder.hidden_size:]
+        return output, hidden
+
+
+class Seq2PoseDecoderGraph(nn.Module):
+    '''
+    a single step of the seq2pos decoder
+
+    note:
+        with a pose decoder the skeleton pose is an extra output,
+        the pca motion is still returned to feed the next step
+    '''
+
+    def __init__(self, decoder, pose_decoder=None):
+        super().__init__()
+        self.decoder = decoder
+        self.pose_decoder = pose_decoder
+
+    def forward(self, motion_input, last_hidden, encoder_outputs):
+        output, hidden, attn_weights = self.decoder(motion_input, last_hidden, encoder_outputs)
+        if self.pose_decoder is not None:
+            return output, hidden, attn_weights, self.pose_decoder(output)
+        return output, hidden, attn_weights
+
+
+def _export(graph, args, path, **kwargs):
+    '''
+    torch.onnx.export of a graph in inference mode
+
+    note:
+        the dynamo exporter (default since torch 2.6) fixes the sequence lengths
+        of the seq2pos encoder, the torchscript exporter keeps the dynamic_axes
+    '''
+    # dropout and batch norm in inference mode, the exporter keeps this mode
+    graph.eval()
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False
+    torch.onnx.export(graph, args, path, **kwargs)
+
+
+def check_graph(graph, path, args, input_names):
+    ''' max difference between the torch graph and onnxruntime for the given inputs '''
+    from onnx_backend import create_session
+
+    with torch.no_grad():
+        expected = graph(*args)
+    expected = expected if isinstance(expected, tuple) else (expected,)
+    outputs = create_session(path).run(None, {name: a.numpy() for name, a in zip(input_names, args)})
+    diff = max(float(np.abs(e.numpy() - o).max()) for e, o in zip(expected, outputs))
+    print('[INFO] {}: max difference to torch {:.2e} (input shapes {})'.format(
+        os.path.basename(path), diff, [tuple(a.shape) for a in args]))
+    return diff
+
+
+def export_transformer(model, opt, path, opset, pose_decoder=None):
+    src_seq = torch.full((1, 8), 4, dtype=torch.long)
+    trg_seq = torch.zeros(1, opt.pre_motions + opt.estimation_motions, opt.d_dec_model)
+    output_names = ['dec_output']
+    dynamic_axes = {
+        'src_seq': {0: 'batch', 1: 'src_len'},
+        'trg_seq': {0: 'batch', 1: 'trg_len'},
+        'dec_output': {0: 'batch', 1: 'trg_len'}}
+    if pose_decoder is not None:
+        output_names.append('pose_output')
+        dynamic_axes['pose_output'] = {0: 'batch', 1: 'trg_len'}
+
+    graph = TransformerGraph(model, pose_decoder)
+    _export(graph, (src_seq, trg_seq), path,
+            input_names=['src_seq', 'trg_seq'],
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset)
+    print('[INFO] transformer graph exported: {}'.format(path))
+
+    # another batch size and sentence length than the traced ones
+    check_graph(graph, path, (torch.full((2, 5), 4, dtype=torch.long), trg_seq.repeat(2, 1, 1)),
+                ['src_seq', 'trg_seq'])
+
+
+def export_seq2pos(model, opt, enc_path, dec_path, opset, pose_decoder=None):
+    src_seq = torch.full((8, 1), 4, dtype=torch.long) # seq x batch
+    enc_graph = Seq2PoseEncoderGraph(model.encoder)
+    _export(enc_graph, (src_seq,), enc_path,
+            input_names=['src_seq'],
+            output_names=['enc_output', 'enc_hidden'],
+            dynamic_axes={
+                'src_seq': {0: 'src_len', 1: 'batch'},
+                'enc_output': {0: 'src_len', 1: 'batch'},
+                'enc_hidden': {1: 'batch'}},
+            opset_version=opset)
+    print('[INFO] seq2pos encoder graph exported: {}'.format(enc_path))
+    check_graph(enc_graph, enc_path, (torch.full((5, 2), 4, dtype=torch.long),), ['src_seq'])
+
+    with torch.no_grad():
+        enc_output, enc_hidden = enc_graph(src_seq)
+    motion_input = torch.zeros(1, model.decoder.output_size)
+    last_hidden = enc_hidden[:model.decoder.n_layers]
+    output_names = ['motion_output', 'hidden', 'attn_weights']
+    dynamic_axes = {
+        'motion_input': {0: 'batch'},
+        'last_hidden': {1: 'batch'},
+        'enc_output': {0: 'src_len', 1: 'batch'},
+        'motion_output': {0: 'batch'},
+        'hidden': {1: 'batch'},
+        'attn_weights': {0: 'batch', 2: 'src_len'}}
+    if pose_decoder is not None:
+        output_names.append('pose_output')
+        dynamic_axes['pose_output'] = {0: 'batch'}
+
+    dec_graph = Seq2PoseDecoderGraph(model.decoder, pose_decoder)
+    _export(dec_graph, (motion_input, last_hidden, enc_output), dec_path,
+            input_names=['motion_input', 'last_hidden', 'enc_output'],
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset)
+    print('[INFO] seq2pos decoder graph exported: {}'.format(dec_path))
+
+    with torch.no_grad():
+        enc_output, enc_hidden = enc_graph(torch.full((5, 2), 4, dtype=torch.long))
+    check_graph(dec_graph, dec_path,
+                (motion_input.repeat(2, 1), enc_hidden[:model.decoder.n_layers], enc_output),
+                ['motion_input', 'last_hidden', 'enc_output'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    parser.add_argument('-checkpoint', default='./trained_model/transformer.chkpt')
+    parser.add_argument('-save_dir', default='./trained_model/onnx/')
+    parser.add_argument('-opset', type=int, default=13)
+    parser.add_argument('-skeleton', type=str2bool, default=False) # also output skeleton poses
+
+    arg = parser.parse_args()
+
+    device = torch.device('cpu')
+    data = torch.load(arg.data)
+    model_info = torch.load(arg.checkpoint, map_location=device)
+    opt = model_info['settings']
+    model = load_model(model_info, data, device)
+    pose_decoder = PoseDecoder.from_pca(data['pca']) if arg.skeleton else None
+
+    os.makedirs(arg.save_dir, exist_ok=True)
+    with torch.no_grad():
+        if opt.model == 'transformer':
+            export_transformer(model, opt, os.path.join(arg.save_dir, 'transformer.onnx'),
+                               arg.opset, pose_decoder)
+        elif opt.model == 'seq2pos':
+            export_seq2pos(model, opt,
+                           os.path.join(arg.save_dir, 'seq2pos_encoder.onnx'),
+                           os.path.join(arg.save_dir, 'seq2pos_decoder.onnx'),
+                           arg.opset, pose_decoder)
+
+
+if __name__ == '__main__':
+    main()
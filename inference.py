@@ -2,26 +2,27 @@ import argparse
 import torch
 import torch.nn as nn
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
-import seaborn as sns
 
-from matplotlib import pyplot, transforms
+from cli import str2bool
 from collections import namedtuple
-from plot import Plot
+from onnx_backend import OnnxModel, load_onnx_model
+from embedding import fill_embedding
+from pose_decoder import PoseDecoder
 from seq2pose.models import Seq2Pose
 from transformer.models import Transformer, get_pad_mask, get_subsequent_mask
 
 import constant as Constant
 
-import matplotlib.pyplot as plt
 import math
+import os
 import random
 import re
 import time, sys, pickle
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
+# outputs are turned into numpy arrays, no graph is needed
+@torch.no_grad()
 def inference(model, input_words, pre_motion_seq, opt, data):
     # make sure encoder and decoder be evaluation mode
     
@@ -40,42 +41,24 @@ def inference(model, input_words, pre_motion_seq, opt, data):
     
     # add EOS
     input_seq[input_seq.shape[0] - 1, 0] = Constant.EOS
-    
+
+    if isinstance(model, OnnxModel):
+        return model.infer(input_seq, pre_motion_seq, opt)
+
+    # quantized models stay on cpu, follow wherever the model lives
+    device = next(model.parameters()).device
+
     input_seq = torch.from_numpy(input_seq).long().to(device)
     pre_motion_seq = torch.from_numpy(pre_motion_seq).float().to(device)
     
     if opt.model == 'seq2pos':
-        # encoding
-        encoder_outputs, encoder_hidden = model.encoder(input_seq, input_length, None)
-        decoder_hidden = encoder_hidden[:decoder.n_layers]
-        
-        target_length = opt.pre_motions + opt.estimation_motions
-        motion_output = np.array([])
-        attentions = torch.zeros((target_length, len(input_seq))) 
-        
-        # time step
-        for t in range(target_length):
-            if t < opt.pre_motions:
-                decoder_input = pre_motion_seq[t].unsqueeze(0).to(device).float()
-                decoder_output, decoder_hidden, attn_weight = model.decoder(decoder_input, 
-                                                                    decoder_hidden,
-                                                                    encoder_outputs)
-            else:
-                decoder_input = decoder_output
-                decoder_output, decoder_hidden, attn_weight = model.decoder(decoder_input, 
-                                                            decoder_hidden, 
-                                                            encoder_outputs)
-                decoder_input = decoder_output.float()
-                
-                if t == opt.pre_motions:
-                    motion_output = decoder_output.data.cpu().numpy()
-                else:
-                    motion_output = np.vstack((motion_output, decoder_output.data.cpu().numpy()))
-            
-            if attn_weight is not None:
-                attentions[t] = attn_weight.data
-        
-        return motion_output, attentions
+        # the decoding loop runs on the device, results are copied back once
+        motion_output, attentions = model.generate(input_seq, input_length,
+                                                   pre_motion_seq.unsqueeze(1),
+                                                   opt.pre_motions, opt.estimation_motions,
+                                                   return_attention=True)
+
+        return motion_output[:, 0].cpu().numpy(), attentions[:, 0].cpu()
     
     elif opt.model == 'transformer':
         input_seq = input_seq.transpose(0, 1)
@@ -92,7 +75,7 @@ def inference(model, input_words, pre_motion_seq, opt, data):
         enc_output = model.pad_linear(enc_output)
 
         dec_output = model.decoder(pre_motion_seq, None, enc_output, input_mask)
-        motion_output = dec_output[0].squeeze(0).data.cpu().numpy()
+        motion_output = estimated_frames(dec_output[0].squeeze(0), opt).data.cpu().numpy()
 
         # # forward decoder
         # for t in range(0, target_length, 10):
@@ -111,6 +94,87 @@ def inference(model, input_words, pre_motion_seq, opt, data):
         return motion_output, None
 
 
+def estimated_frames(motion, opt):
+    '''
+    the transformer decodes pre_motions + estimation_motions frames per window,
+    the leading pre motion frames are not trained. window k covers the frames
+    [k * estimation_motions, (k + 1) * estimation_motions) of the utterance
+    '''
+    return motion[..., -opt.estimation_motions:, :]
+
+
+def words_to_seq(windows, word2idx, pad_idx=Constant.PAD):
+    '''
+    convert word windows into a padded index array
+
+    return:
+        batch x seq array with SOS and EOS around every window
+    '''
+    max_len = max(len(words) for words in windows) + 2
+    input_seq = np.full((len(windows), max_len), pad_idx, dtype=np.int64)
+    for b, words in enumerate(windows):
+        input_seq[b, 0] = Constant.BOS
+        for i, word in enumerate(words):
+            input_seq[b, i + 1] = word2idx.get(word, Constant.UNK)
+        input_seq[b, len(words) + 1] = Constant.EOS
+
+    return input_seq
+
+
+@torch.no_grad()
+def inference_batch(model, windows, opt, data):
+    '''
+    transformer inference of independent word windows in a single forward pass
+
+    note:
+        the decoder starts from zero motion as in inference(), so padding the
+        windows into one batch gives the same motion as one call per window
+    return:
+        list of motion outputs, one [estimation_motions x dim] array per window
+    '''
+    input_seq = words_to_seq(windows, data['dict'], opt.src_pad_idx)
+    n_components = data['pca'].n_components
+
+    if isinstance(model, OnnxModel):
+        return list(estimated_frames(model.infer_batch(input_seq, n_components), opt))
+
+    device = next(model.parameters()).device
+    input_seq = torch.from_numpy(input_seq).to(device)
+    pre_motion_seq = torch.zeros(len(windows), 30, n_components, device=device)
+
+    input_mask = get_pad_mask(input_seq, opt.src_pad_idx)
+    enc_output, *_ = model.encoder(input_seq, input_mask)
+    enc_output = model.pad_linear(enc_output)
+    dec_output, *_ = model.decoder(pre_motion_seq, None, enc_output, input_mask)
+
+    return list(estimated_frames(dec_output, opt).cpu().numpy())
+
+
+@torch.no_grad()
+def inference_seq2pos_batch(model, windows, pre_motion_seqs, opt, data):
+    '''
+    seq2pos inference of word windows from different utterances in a single decoding loop
+
+    param:
+        windows - list of word windows
+        pre_motion_seqs - list of seed motions, one [frames x dim] array per window
+    return:
+        list of motion outputs, one [estimation_motions x dim] array per window
+    '''
+    input_seq = words_to_seq(windows, data['dict'], getattr(opt, 'src_pad_idx', Constant.PAD))
+    input_length = [len(words) + 2 for words in windows]
+
+    device = next(model.parameters()).device
+    input_seq = torch.from_numpy(input_seq).to(device).transpose(0, 1) # seq x batch
+    pre_motion_seq = np.stack([np.asarray(m)[:opt.pre_motions] for m in pre_motion_seqs], axis=1)
+    pre_motion_seq = torch.from_numpy(pre_motion_seq).float().to(device)
+
+    motion_output, _ = model.generate(input_seq, input_length, pre_motion_seq,
+                                      opt.pre_motions, opt.estimation_motions)
+
+    return list(motion_output.transpose(0, 1).cpu().numpy())
+
+
 def _model_decode(decoder, trg_seq, enc_output, src_mask):
     dec_output, *_ = decoder(trg_seq, None, enc_output, src_mask)
     return dec_output
@@ -129,53 +193,19 @@ def normalized_string(sentence):
     return text
 
 
-def main():
-    parser = argparse.ArgumentParser()
-
-    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
-    # parser.add_argument('-checkpoint', default='./trained_model/trained_model_seq2pos/seq2pos_tr_loss_570_-1.354.chkpt')
-    parser.add_argument('-checkpoint', default='./trained_model/transformer.chkpt')
-    parser.add_argument('-ground_truth', type=bool, default=False)
-    parser.add_argument('-n_filter', type=int, default=3)
+def load_model(model_info, data, device):
+    '''
+    build the model described by the checkpoint settings and load its trained state
 
-    arg = parser.parse_args()
-
-    data = torch.load(arg.data)
-    model_info = torch.load(arg.checkpoint)
-
-    if arg.ground_truth:
-        index = random.randrange(0, len(data['valid']['src']))
-        sample_src = data['valid']['src'][index]
-        sample_tgt = data['valid']['tgt'][index]
-        poses = np.zeros((len(sample_tgt), 24)) # to store the outputs
-        word = []
-        for src in sample_src:
-            for k, v in data['dict'].items():
-                if src == v:
-                    word.append(k)
-        print('selected index: {}'.format(index))
-        print('sample words: {} \n\t{}'.format(len(word), word))
-        print('pose length: {}'.format(len(sample_tgt)))
-        
-        start = 0
-        for pose in sample_tgt:
-            poses[start] = data['pca'].inverse_transform(pose)
-            start += 1
-        p = Plot((-7, 7), (-7, 7))
-        poses = pd.DataFrame(poses).rolling(arg.n_filter).mean()
-        poses = np.array(poses)
-        anim = p.animate(poses, 80)
-        # p.save(anim, "./videos/groud_truth.mp4")
-        plt.show()
-        exit(-1)
-
-
-    ############################################
-    #               Prepare Model              #
-    ############################################
+    param:
+        model_info - checkpoint dictionary with 'model' and 'settings'
+        data - preprocessed data with 'emb_tbl' and 'pca'
+        device - target device
+    return:
+        model in evaluation mode
+    '''
     state = model_info['model']
     opt = model_info['settings']
-    # opt.pre_motions = 5
 
     if opt.model == 'transformer':
         print('[INFO] Transformer model selected.')
@@ -192,11 +222,7 @@ def main():
                 d_v=opt.d_v,
                 n_head=opt.n_head,
                 dropout=opt.dropout).to(device)
-        # load trained state
-        model.load_state_dict(state)
-        # turn model into evaluation mode
-        model.eval()
-    
+
     elif opt.model == 'seq2pos':
         print('[INFO] Seq2Pos model selected.')
         model = Seq2Pose(
@@ -208,56 +234,209 @@ def main():
                 bidirectional=opt.bidirectional,
                 dropout=opt.dropout,
                 out_dim = data['pca'].n_components).to(device)
-        # load trained state
-        model.load_state_dict(state)
-        # turn model into evaluation mode
-        model.eval()
 
-    def infer_from_words(words, sp_duration=None):
-        start = time.time()
+    if model_info.get('quantized'):
+        # quantized modules have to exist before their packed weights can be loaded
+        from quantize import quantize_model
+        print('[INFO] Dynamic int8 quantized checkpoint.')
+        model = quantize_model(model.cpu())
 
-        if sp_duration is None:
-            # speech duration
-            # assume average speech speed (150 wpm = 2.5 wps)
-            sp_duration = len(words) / 2.5
+    # load trained state, the frozen embedding may be shared with the data file
+    model.load_state_dict(fill_embedding(state, model))
+    # turn model into evaluation mode
+    model.eval()
 
-        # prefix values
-        # unit_dration = 0.08333 # seconds per frame (dataset has 12 fps)
-        frame_duration = 1/12
+    return model
 
-        pre_duration = opt.pre_motions * frame_duration
-        motion_duration = opt.estimation_motions * frame_duration
 
-        num_words_for_pre_motion = round(len(words) * pre_duration / sp_duration)
-        num_words_for_estimation = round(len(words) * motion_duration / sp_duration)
+def split_windows(words, opt, sp_duration=None):
+    '''
+    split words into the overlapping windows the models are trained on
 
-        padded_words = [Constant.UNK_WORD] * num_words_for_pre_motion + words
+    return:
+        list of word windows, number of words for the pre motion
+    '''
+    if sp_duration is None:
+        # speech duration
+        # assume average speech speed (150 wpm = 2.5 wps)
+        sp_duration = len(words) / 2.5
 
-        # output tuple to save all related information
-        output_tuple = namedtuple('InferenceOutput', ['words', 'pre_motion_seq', 'out_motion', 'attention'])
-        
-        # previous motion seq
-        # pre_motion_seq = np.zeros((opt.pre_motions, data['pca'].n_components))
-        pre_motion_seq = np.zeros((30, data['pca'].n_components))
-
-        # to store motion outputs
-        outputs = []
-        for i in range(0, len(padded_words) - num_words_for_pre_motion, num_words_for_estimation):
-            sample_words = padded_words[i:i + num_words_for_pre_motion + num_words_for_estimation]
+    # prefix values
+    # unit_dration = 0.08333 # seconds per frame (dataset has 12 fps)
+    frame_duration = 1/12
+
+    pre_duration = opt.pre_motions * frame_duration
+    motion_duration = opt.estimation_motions * frame_duration
+
+    num_words_for_pre_motion = round(len(words) * pre_duration / sp_duration)
+    num_words_for_estimation = round(len(words) * motion_duration / sp_duration)
+    if opt.model == 'transformer':
+        # encoder positions are limited to n_position (with SOS and EOS)
+        num_words_for_estimation = min(num_words_for_estimation,
+                                       getattr(opt, 'n_position', 10) - 2 - num_words_for_pre_motion)
+    # slow speech, every window still moves on by at least one word
+    num_words_for_estimation = max(num_words_for_estimation, 1)
+
+    padded_words = [Constant.UNK_WORD] * num_words_for_pre_motion + words
+
+    windows = [padded_words[i:i + num_words_for_pre_motion + num_words_for_estimation]
+               for i in range(0, len(padded_words) - num_words_for_pre_motion, num_words_for_estimation)]
+
+    return windows, num_words_for_pre_motion
+
+
+def infer_from_words(model, words, opt, data, sp_duration=None, cache=None):
+    '''
+    generate the motion of an utterance window by window
+
+    param:
+        cache - optional MotionCache (motion_cache.py), windows already
+                generated with the same words and pre motion are not inferred again
+    '''
+    windows, _ = split_windows(words, opt, sp_duration)
+
+    # output tuple to save all related information
+    output_tuple = namedtuple('InferenceOutput', ['words', 'pre_motion_seq', 'out_motion', 'attention'])
+    
+    # previous motion seq
+    # pre_motion_seq = np.zeros((opt.pre_motions, data['pca'].n_components))
+    pre_motion_seq = np.zeros((30, data['pca'].n_components))
+
+    # to store motion outputs
+    outputs = []
+    if opt.model == 'transformer':
+        # the transformer ignores the pre motion, the words alone identify a window
+        keys = [cache.key(sample_words) for sample_words in windows] if cache else [None] * len(windows)
+        motions = [cache.get(key) for key in keys] if cache else [None] * len(windows)
+        missing = [i for i, motion in enumerate(motions) if motion is None]
+
+        # windows do not depend on each other, run all of them in one forward pass
+        if missing:
             with torch.no_grad():
-                output, attention = inference(
-                                        model=model,
-                                        input_words=sample_words,
-                                        pre_motion_seq=pre_motion_seq,
-                                        opt=opt,
-                                        data=data)
-                
-                outputs.append(output_tuple(sample_words, pre_motion_seq, output, attention))
-                # pre_motion_seq = np.asarray(output)[-opt.pre_motions:, :]
-                pre_motion_seq = np.asarray(output)[:]
-                
+                for i, output in zip(missing, inference_batch(model, [windows[i] for i in missing], opt, data)):
+                    motions[i] = output
+                    if cache:
+                        cache.put(keys[i], output)
+
+        for sample_words, output in zip(windows, motions):
+            outputs.append(output_tuple(sample_words, pre_motion_seq, output, None))
+            pre_motion_seq = output
         return outputs
 
+    for sample_words in windows:
+        if cache:
+            key = cache.key(sample_words, np.asarray(pre_motion_seq)[:opt.pre_motions])
+            output = cache.get(key)
+            if output is not None:
+                # attention is not cached
+                outputs.append(output_tuple(sample_words, pre_motion_seq, output, None))
+                pre_motion_seq = output
+                continue
+
+        with torch.no_grad():
+            output, attention = inference(
+                                    model=model,
+                                    input_words=sample_words,
+                                    pre_motion_seq=pre_motion_seq,
+                                    opt=opt,
+                                    data=data)
+            
+            outputs.append(output_tuple(sample_words, pre_motion_seq, output, attention))
+            # pre_motion_seq = np.asarray(output)[-opt.pre_motions:, :]
+            pre_motion_seq = np.asarray(output)[:]
+
+        if cache:
+            cache.put(key, pre_motion_seq)
+            
+    return outputs
+
+
+def main():
+    # plotting libraries are only needed here, importing the module stays light
+    import matplotlib.pyplot as plt
+    from plot import Plot
+    from smoothing import add_filter_args, filter_from_args
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    # parser.add_argument('-checkpoint', default='./trained_model/trained_model_seq2pos/seq2pos_tr_loss_570_-1.354.chkpt')
+    parser.add_argument('-checkpoint', default='./trained_model/transformer.chkpt')
+    parser.add_argument('-ground_truth', type=bool, default=False)
+    add_filter_args(parser)
+    parser.add_argument('-quantize', type=str2bool, default=False)
+    parser.add_argument('-backend', default='torch') # torch or onnx
+    parser.add_argument('-onnx_dir', default='./trained_model/onnx/')
+    parser.add_argument('-n_threads', type=int, default=0)
+    parser.add_argument('-bundle', default=None) # use an inference bundle instead of -data / -checkpoint
+    parser.add_argument('-cache_dir', default=None) # reuse motion windows generated by earlier runs
+    parser.add_argument('-cache_size', type=int, default=4096)
+    parser.add_argument('-renderer', default='numpy') # numpy (render.py) or matplotlib
+    parser.add_argument('-render_workers', type=int, default=1) # > 1: render frame ranges in parallel
+    parser.add_argument('-save_motion', default=None) # compact motion file for robot playback (motion_io.py)
+    parser.add_argument('-motion_encoding', default='float16') # float16, delta16 or delta8
+
+    arg = parser.parse_args()
+    smoother = filter_from_args(arg)
+
+    if arg.ground_truth and arg.bundle:
+        # bundles have no validation split, the ground truth clip comes from -data
+        if not os.path.exists(arg.data):
+            parser.error('-ground_truth reads the validation split of -data, '
+                         'which the bundle does not contain: {} not found'.format(arg.data))
+        print('[INFO] -ground_truth uses the validation split of: {}'.format(arg.data))
+        data = torch.load(arg.data)
+    elif arg.bundle:
+        from bundle import load_bundle
+        print('[INFO] load inference bundle: {}'.format(arg.bundle))
+        model, opt, data = load_bundle(arg.bundle, device, quantize=arg.quantize)
+        model_info = {'settings': opt}
+    else:
+        data = torch.load(arg.data)
+        model_info = torch.load(arg.checkpoint)
+
+    if arg.ground_truth:
+        index = random.randrange(0, len(data['valid']['src']))
+        sample_src = data['valid']['src'][index]
+        sample_tgt = data['valid']['tgt'][index]
+        word = []
+        for src in sample_src:
+            for k, v in data['dict'].items():
+                if src == v:
+                    word.append(k)
+        print('selected index: {}'.format(index))
+        print('sample words: {} \n\t{}'.format(len(word), word))
+        print('pose length: {}'.format(len(sample_tgt)))
+        
+        poses = PoseDecoder.from_pca(data['pca']).decode(sample_tgt)
+        p = Plot((-7, 7), (-7, 7))
+        if smoother is not None:
+            poses = smoother(poses)
+        anim = p.animate(poses, 80)
+        # p.save(anim, "./videos/groud_truth.mp4")
+        plt.show()
+        exit(-1)
+
+
+    ############################################
+    #               Prepare Model              #
+    ############################################
+    opt = model_info['settings']
+    # opt.pre_motions = 5
+
+    if arg.n_threads > 0:
+        torch.set_num_threads(arg.n_threads)
+
+    if arg.backend == 'onnx':
+        print('[INFO] onnxruntime backend: {}'.format(arg.onnx_dir))
+        model = load_onnx_model(arg.onnx_dir, opt, arg.n_threads)
+    elif not arg.bundle:
+        model = load_model(model_info, data, device)
+
+        if arg.quantize and not model_info.get('quantized'):
+            from quantize import quantize_model
+            print('[INFO] Apply dynamic int8 quantization.')
+            model = quantize_model(model)
 
     # inference
     # sentence = "look at the big world in front of you ,"
@@ -267,35 +446,54 @@ def main():
     # sentence = '''and men in general are physically stronger of course there are many exceptions laughter but today we live in a vastly different world the person more likely to lead is not the physically stronger person it is the more creative person the more intelligent person the more innovative person and there are no hormones for those attributes a man is as likely as a woman to be intelligent to be creative to be innovative we have evolved but it seems to me that our ideas of gender had not evolved some weeks ago i walked into a lobby of one of the best nigerian hotels i thought about naming the hotel but i thought i probably shouldnt and a guard at the entrance stopped me and asked me annoying questions because their automatic assumption is that a nigerian female walking into a hotel alone is a sex worker'''
     # sentence = "Witnesses told the Herald the brawl kicked off around 3pm and at one point a beer bottle was smashed over the head of a teen"
     
+    cache = None
+    if arg.cache_dir:
+        from motion_cache import MotionCache, model_hash, file_hash
+        if isinstance(model, OnnxModel):
+            model_id = '-'.join(file_hash(os.path.join(arg.onnx_dir, f))
+                                for f in sorted(os.listdir(arg.onnx_dir)) if f.endswith('.onnx'))
+        else:
+            model_id = model_hash(model)
+        cache = MotionCache(model_id, arg.cache_size, arg.cache_dir)
+
     words = normalized_string(sentence).split(' ')
-    outputs = infer_from_words(words)
+    outputs = infer_from_words(model, words, opt, data, cache=cache)
+    if cache:
+        print('[INFO] motion cache: {}'.format(cache.stats()))
 
-    poses = np.zeros((len(outputs)*30, 24)) # to store the outputs
-    print("output pose frames: {}".format(poses.shape[0]))
-    
     # we define offset to maximize gesture generated
     offset = 1.0
 
-    start = 0
-    for out in outputs:
-        out_m = np.array(out.out_motion)
-        out_m = out_m * offset
-        for pose in out_m:
-            poses[start] = data['pca'].inverse_transform(pose)
-            start += 1
+    motion = np.concatenate([np.asarray(out.out_motion) for out in outputs]) * offset
+    # every frame is decoded into a skeleton in one matmul
+    poses = PoseDecoder.from_pca(data['pca']).decode(motion)
+    print("output pose frames: {}".format(poses.shape[0]))
     
     # save output poses
     # torch.save(poses, "./videos/output.pickle")
     # print("[INFO] output saved.")
     # exit(-1)
 
-    # plot class
-    p = Plot((-7, 7), (-7, 7))
-    # mean average filtering
-    poses = pd.DataFrame(poses).rolling(arg.n_filter).mean()
-    poses = np.array(poses)
-    anim = p.animate(poses, 100000)
-    p.save(anim, "./videos/predict_test.mp4")
+    # causal filtering of the joints, same as the streaming and batch output
+    if smoother is not None:
+        poses = smoother(poses)
+    if arg.save_motion:
+        from motion_io import save_motion
+        # the dataset has 12 fps
+        save_motion(arg.save_motion, poses, fps=12, layout='joints', encoding=arg.motion_encoding)
+        print('[INFO] motion saved: {}'.format(arg.save_motion))
+    if arg.renderer == 'numpy':
+        from render import SkeletonRenderer
+        renderer = SkeletonRenderer((-7, 7), (-7, 7))
+        if arg.render_workers > 1:
+            renderer.save_parallel(poses, "./videos/predict_test.mp4", arg.render_workers)
+        else:
+            renderer.save(poses, "./videos/predict_test.mp4")
+    else:
+        # plot class
+        p = Plot((-7, 7), (-7, 7))
+        anim = p.animate(poses, 100000)
+        p.save(anim, "./videos/predict_test.mp4")
     # plt.show()
 
 
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import time
+
+
+class MetricsLog():
+    '''
+    append-only ndjson training log, one record per step and per epoch
+
+        {"kind": "step", "epoch": 3, "step": 1204, "time": ..., "loss": 0.12}
+        {"kind": "epoch", "epoch": 3, "step": 1240, "time": ..., "train_loss": ..., "valid_loss": ...}
+        {"kind": "valid", "epoch": 3, "step": 1302, "time": ..., "valid_loss": ...}
+
+    valid records come from the background validation and may be written
+    after later epochs have started
+
+    note:
+        every record is flushed as it is written, so a viewer sees it right away.
+        a resumed run continues the step count of the existing log.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        last = last_record(path)
+        self.step = last['step'] if last else 0
+        self.epoch = last['epoch'] if last else 0
+        self.file = open(path, 'a')
+
+    def _write(self, kind, values, epoch=None):
+        epoch = self.epoch if epoch is None else epoch
+        record = {'kind': kind, 'epoch': epoch, 'step': self.step, 'time': time.time()}
+        record.update(values)
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def start_epoch(self, epoch):
+        self.epoch = epoch
+
+    def log_step(self, **values):
+        self.step += 1
+        self._write('step', values)
+
+    def log_epoch(self, **values):
+        self._write('epoch', values)
+
+    def log_valid(self, epoch, **values):
+        self._write('valid', values, epoch)
+
+    def close(self):
+        self.file.close()
+
+
+def last_record(path, block=4096):
+    ''' last complete record of a log, read from the end of the file '''
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - block, 0))
+        lines = f.read().splitlines()
+    for line in reversed(lines):
+        try:
+            return json.loads(line)
+        except ValueError:
+            # partial line at the end or cut at the start of the block
+            continue
+    return None
+
+
+class MetricsReader():
+    ''' read the records added to a log since the last call '''
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = b''
+
+    def read_new(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read()
+            self.offset = f.tell()
+
+        lines = (self.partial + chunk).split(b'\n')
+        # the last piece is empty or a record that is still being written
+        self.partial = lines.pop()
+
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # a line cut short by a killed trainer, the resumed run appends after it
+                print('[WARNING] skipped an undecodable line of {}: {!r}'.format(self.path, line[:80]))
+        return records
+
+
+class LiveLossViewer():
+    '''
+    plot step loss and epoch losses of a running training
+
+    note:
+        only the records written since the last poll are parsed. the points
+        are appended to one line per series, but only the new tail (from the
+        last drawn point on) is blitted onto the previous frame. the whole
+        figure is only drawn again when the axes have to grow (limits get
+        headroom so this is rare) or the window is resized.
+    '''
+
+    def __init__(self, path):
+        import matplotlib.pyplot as plt
+
+        self.plt = plt
+        self.reader = MetricsReader(path)
+        self.fig, (self.ax_step, self.ax_epoch) = plt.subplots(2, 1, figsize=(12, 8))
+        self.fig.suptitle(path)
+
+        lines = {
+            'loss': self.ax_step.plot([], [], lw=1, label='step loss')[0],
+            'train_loss': self.ax_epoch.plot([], [], '-o', label='train')[0],
+            'valid_loss': self.ax_epoch.plot([], [], '-o', label='valid')[0],
+        }
+        # key -> (xs, ys, line with every point, tail with the points of the last poll)
+        self.series = {}
+        for key, line in lines.items():
+            # animated: full draws leave the tail out, the line already has its points
+            tail, = line.axes.plot([], [], color=line.get_color(), linestyle=line.get_linestyle(),
+                                   lw=line.get_linewidth(), marker=line.get_marker(), animated=True)
+            self.series[key] = ([], [], line, tail)
+        # data bounds per axes, [xmin, xmax, ymin, ymax]
+        self.bounds = {}
+        self.ax_step.set_xlabel('Step')
+        self.ax_epoch.set_xlabel('Epoch')
+        for ax in (self.ax_step, self.ax_epoch):
+            ax.set_ylabel('Loss')
+            ax.legend()
+
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        if self.fig.canvas.supports_blit:
+            self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def _grow_limits(self, ax, xs, ys):
+        ''' return: True when the limits changed and the figure has to be drawn again '''
+        old = self.bounds.get(ax)
+        new = [min(xs), max(xs), min(ys), max(ys)]
+        if old is not None:
+            new = [min(old[0], new[0]), max(old[1], new[1]), min(old[2], new[2]), max(old[3], new[3])]
+        self.bounds[ax] = new
+
+        x0, x1 = ax.get_xlim()
+        y0, y1 = ax.get_ylim()
+        if old is not None and x0 <= new[0] and new[1] <= x1 and y0 <= new[2] and new[3] <= y1:
+            return False
+        # twice the steps seen so far and some room around the losses
+        x_span = max(new[1] - new[0], 1)
+        y_pad = max(new[3] - new[2], abs(new[3]) * 0.1, 1e-3) * 0.25
+        ax.set_xlim(new[0], new[0] + 2 * x_span)
+        ax.set_ylim(new[2] - y_pad, new[3] + y_pad)
+        return True
+
+    def update(self):
+        records = self.reader.read_new()
+        points = {key: [] for key in self.series}
+        for record in records:
+            x = record['step'] if record['kind'] == 'step' else record['epoch']
+            for key in self.series:
+                if key in record:
+                    points[key].append((x, record[key]))
+
+        tails = []
+        redraw = self.background is None
+        for key, new in points.items():
+            if not new:
+                continue
+            xs, ys, line, tail = self.series[key]
+            # the tail starts at the last point that is already drawn
+            start = max(len(xs) - 1, 0)
+            for x, y in new:
+                xs.append(x)
+                ys.append(y)
+            line.set_data(xs, ys)
+            tail.set_data(xs[start:], ys[start:])
+            tails.append(tail)
+            redraw = self._grow_limits(line.axes, xs[start:], ys[start:]) or redraw
+
+        if tails:
+            canvas = self.fig.canvas
+            if redraw:
+                # draw_event keeps the background for the next blits
+                canvas.draw()
+            else:
+                canvas.restore_region(self.background)
+                for tail in tails:
+                    tail.axes.draw_artist(tail)
+                canvas.blit(self.fig.bbox)
+                self.background = canvas.copy_from_bbox(self.fig.bbox)
+        return len(records)
+
+    def run(self, interval=2.0):
+        self.plt.ion()
+        self.plt.show()
+        while self.plt.fignum_exists(self.fig.number):
+            self.update()
+            # not plt.pause, it would draw the whole (stale) figure every poll
+            self.fig.canvas.flush_events()
+            self.fig.canvas.start_event_loop(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-model', default='transformer')
+    parser.add_argument('-log', default='./log/')
+    parser.add_argument('-interval', type=float, default=2.0) # seconds between polls
+
+    opt = parser.parse_args()
+
+    LiveLossViewer(opt.log + '{}_metrics.ndjson'.format(opt.model)).run(opt.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import hashlib
+import io
+import os
+import threading
+import torch
+import numpy as np
+
+from collections import OrderedDict
+
+
+def model_hash(model):
+    ''' hash of the model weights, equal weights give equal hashes '''
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return hashlib.sha1(buf.getvalue()).hexdigest()
+
+
+def file_hash(path):
+    ''' hash of a checkpoint, bundle or onnx file '''
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class MotionCache():
+    '''
+    bounded lru cache of generated pca motion windows
+
+    param:
+        model_id - hash of the model or checkpoint (see model_hash, file_hash)
+        max_size - number of windows kept, the least recently used is dropped
+        cache_dir - optional directory, windows are also stored there as .npy
+                    and reused by later runs with the same model
+    note:
+        a window is identified by its words, the model and the pre motion seed
+        the model was given. pass seed=None for models that ignore the pre
+        motion (transformer).
+    '''
+
+    def __init__(self, model_id, max_size=4096, cache_dir=None):
+        self.model_id = model_id
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        # key -> motion, None when the motion is only on disk
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # batch inference and the server run windows from several threads
+        self.lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            files = [f for f in os.listdir(cache_dir) if f.endswith('.npy')]
+            # oldest first, so the most recently written windows survive the size limit
+            files.sort(key=lambda f: os.path.getmtime(os.path.join(cache_dir, f)))
+            for f in files:
+                self.entries[f[:-len('.npy')]] = None
+            self._evict()
+
+    def key(self, words, seed=None):
+        sha = hashlib.sha1(self.model_id.encode())
+        sha.update('\x00'.join(words).encode())
+        if seed is not None:
+            sha.update(np.ascontiguousarray(seed, dtype=np.float32).tobytes())
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npy')
+
+    def _evict(self):
+        while len(self.entries) > self.max_size:
+            key, _ = self.entries.popitem(last=False)
+            if self.cache_dir and os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+
+    def get(self, key):
+        ''' cached motion or None '''
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            motion = self.entries[key]
+            if motion is None:
+                try:
+                    motion = np.load(self._path(key))
+                except (IOError, ValueError):
+                    # removed by another process
+                    del self.entries[key]
+                    self.misses += 1
+                    return None
+                self.entries[key] = motion
+            self.hits += 1
+            return motion
+
+    def put(self, key, motion):
+        motion = np.asarray(motion)
+        with self.lock:
+            self.entries[key] = motion
+            self.entries.move_to_end(key)
+            if self.cache_dir:
+                # write and rename, other processes never see a partial file
+                tmp = self._path(key) + '.tmp'
+                with open(tmp, 'wb') as f:
+                    np.save(f, motion)
+                os.replace(tmp, self._path(key))
+            self._evict()
+
+    def stats(self):
+        n_lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / n_lookups if n_lookups else 0.0,
+            'size': len(self.entries)
+        }
+
+    def clear(self):
+        with self.lock:
+            if self.cache_dir:
+                for key in self.entries:
+                    if os.path.exists(self._path(key)):
+                        os.remove(self._path(key))
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
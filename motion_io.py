@@ -0,0 +1,221 @@
+import argparse
+import itertools
+import os
+import struct
+import numpy as np
+
+
+# motion file layout
+#
+#   header (32 bytes, little endian)
+#       magic b'MOTN', version u16, encoding u8, layout u8, n_dims u16,
+#       fps f32, n_frames u32, chunk_frames u32, step f32 (fixed step of the writer,
+#       0: derived for every chunk. the chunks always store the step they use)
+#   frames
+#       float16 - [n_frames x n_dims] float16, can be memory mapped as is
+#       delta16 / delta8 - chunks of chunk_frames frames, every chunk is a float32
+#                 key frame and a float32 step followed by int16 / int8 frame to
+#                 frame deltas in units of the step
+
+MAGIC = b'MOTN'
+VERSION = 1
+HEADER = struct.Struct('<4sHBBHfIIf6x')
+ENCODINGS = ['float16', 'delta16', 'delta8']
+DELTA_DTYPES = {'delta16': np.int16, 'delta8': np.int8}
+# pca coefficients or 8 joints x (x, y, z) as decoded by PoseDecoder
+LAYOUTS = ['pca', 'joints']
+# n_frames of a file that is still being written
+UNKNOWN = 0xFFFFFFFF
+
+
+class MotionWriter():
+    '''
+    write motion frame chunk by frame chunk
+
+    param:
+        n_dims - values per frame (24 for joints, n_components for pca)
+        encoding - float16, delta16 or delta8
+        step - quantization step of the deltas, None derives it for every chunk
+               from its largest frame to frame delta, so nothing is clipped.
+               a fixed step limits a frame to 127 * step (delta8) or
+               32767 * step (delta16) of movement, larger deltas are clipped
+               and caught up on the following frames (the deltas are encoded
+               closed loop, the error does not add up over time)
+    '''
+
+    def __init__(self, path, n_dims, fps=12, layout='joints', encoding='float16',
+                 chunk_frames=256, step=None):
+        self.n_dims = n_dims
+        self.fps = fps
+        self.layout = layout
+        self.encoding = encoding
+        self.chunk_frames = chunk_frames
+        self.step = step
+        self.n_clipped = 0
+        self.n_frames = 0
+        self.pending = np.zeros((0, n_dims), dtype=np.float32)
+
+        self.file = open(path, 'wb')
+        self._write_header(UNKNOWN)
+
+    def _write_header(self, n_frames):
+        self.file.write(HEADER.pack(MAGIC, VERSION, ENCODINGS.index(self.encoding),
+                                    LAYOUTS.index(self.layout), self.n_dims, self.fps,
+                                    n_frames, self.chunk_frames, self.step or 0))
+
+    def _encode_chunk(self, frames):
+        if self.encoding == 'float16':
+            return frames.astype(np.float16).tobytes()
+
+        dtype = DELTA_DTYPES[self.encoding]
+        limit = np.iinfo(dtype).max
+        key = frames[0].astype(np.float32)
+        step = self.step
+        if step is None:
+            # the reconstruction is off by at most half a step, one step of headroom
+            max_delta = np.abs(np.diff(frames.astype(np.float64), axis=0)).max() if len(frames) > 1 else 0
+            step = max(max_delta / (limit - 1), 1e-8)
+        step = np.float32(step)
+
+        deltas = np.zeros((len(frames) - 1, self.n_dims), dtype=dtype)
+        prev = key.astype(np.float64)
+        for t in range(1, len(frames)):
+            # delta against the reconstructed frame, not the original one
+            q = np.round((frames[t] - prev) / step)
+            self.n_clipped += int((np.abs(q) > limit).sum())
+            q = np.clip(q, -limit, limit)
+            deltas[t - 1] = q
+            prev = prev + q * step
+        return key.tobytes() + step.tobytes() + deltas.tobytes()
+
+    def write(self, frames):
+        ''' frames: [frames x n_dims], complete chunks are written right away '''
+        frames = np.asarray(frames, dtype=np.float32).reshape(-1, self.n_dims)
+        self.pending = np.concatenate((self.pending, frames))
+        n_full = len(self.pending) // self.chunk_frames * self.chunk_frames
+        for start in range(0, n_full, self.chunk_frames):
+            self.file.write(self._encode_chunk(self.pending[start:start + self.chunk_frames]))
+        self.n_frames += n_full
+        self.pending = self.pending[n_full:]
+        self.file.flush()
+
+    def close(self):
+        if len(self.pending) > 0:
+            self.file.write(self._encode_chunk(self.pending))
+            self.n_frames += len(self.pending)
+            self.pending = self.pending[:0]
+        self.file.seek(0)
+        self._write_header(self.n_frames)
+        self.file.close()
+        if self.n_clipped:
+            print('[WARNING] {} deltas were clipped by the fixed step {}, the motion lags behind '
+                  'fast movement (step=None derives it from the data)'.format(self.n_clipped, self.step))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MotionReader():
+    '''
+    read a motion file chunk by chunk, files that are still being written can be
+    read up to their last complete chunk
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        magic, version, encoding, layout, self.n_dims, self.fps, n_frames, self.chunk_frames, self.step = \
+            HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a motion file: {}'.format(path))
+        self.encoding = ENCODINGS[encoding]
+        self.layout = LAYOUTS[layout]
+        self.complete = n_frames != UNKNOWN
+        self.n_frames = n_frames if self.complete else self._frames_on_disk()
+
+    def _chunk_bytes(self, n_frames):
+        if self.encoding == 'float16':
+            return 2 * n_frames * self.n_dims
+        itemsize = np.dtype(DELTA_DTYPES[self.encoding]).itemsize
+        # key frame, step and deltas
+        return 4 * self.n_dims + 4 + itemsize * (n_frames - 1) * self.n_dims
+
+    def _frames_on_disk(self):
+        data_bytes = os.path.getsize(self.path) - HEADER.size
+        return data_bytes // self._chunk_bytes(self.chunk_frames) * self.chunk_frames
+
+    def _decode_chunk(self, buf, n_frames):
+        if self.encoding == 'float16':
+            return np.frombuffer(buf, dtype=np.float16).reshape(n_frames, self.n_dims).astype(np.float32)
+
+        key = np.frombuffer(buf, dtype=np.float32, count=self.n_dims).astype(np.float64)
+        step = np.frombuffer(buf, dtype=np.float32, count=1, offset=4 * self.n_dims)[0]
+        if self.step and step != np.float32(self.step):
+            raise ValueError('chunk step {} does not match the fixed step {} of {}'.format(
+                                                                    step, self.step, self.path))
+        deltas = np.frombuffer(buf, dtype=DELTA_DTYPES[self.encoding],
+                               offset=4 * self.n_dims + 4).reshape(n_frames - 1, self.n_dims)
+        frames = np.concatenate((key[np.newaxis], key + np.cumsum(deltas * np.float64(step), axis=0)))
+        return frames.astype(np.float32)
+
+    def chunks(self, start_chunk=0):
+        ''' yield [frames x n_dims] float32 arrays, one per chunk '''
+        with open(self.path, 'rb') as f:
+            for start in range(start_chunk * self.chunk_frames, self.n_frames, self.chunk_frames):
+                n_frames = min(self.chunk_frames, self.n_frames - start)
+                f.seek(HEADER.size + start // self.chunk_frames * self._chunk_bytes(self.chunk_frames))
+                yield self._decode_chunk(f.read(self._chunk_bytes(n_frames)), n_frames)
+
+    def read(self, start=0, stop=None):
+        ''' frames [start, stop) as float32 '''
+        stop = self.n_frames if stop is None else min(stop, self.n_frames)
+        if start >= stop:
+            return np.zeros((0, self.n_dims), dtype=np.float32)
+        if self.encoding == 'float16':
+            return self.memmap()[start:stop].astype(np.float32)
+
+        first = start // self.chunk_frames
+        last = (stop - 1) // self.chunk_frames
+        frames = list(itertools.islice(self.chunks(first), last - first + 1))
+        offset = first * self.chunk_frames
+        return np.concatenate(frames)[start - offset:stop - offset]
+
+    def memmap(self):
+        ''' float16 files as a read only [frames x n_dims] array, nothing is parsed or copied '''
+        if self.encoding != 'float16':
+            raise ValueError('only float16 motion files can be memory mapped')
+        return np.memmap(self.path, dtype=np.float16, mode='r', offset=HEADER.size,
+                         shape=(self.n_frames, self.n_dims))
+
+
+def save_motion(path, frames, fps=12, layout='joints', encoding='float16', **kwargs):
+    frames = np.asarray(frames)
+    with MotionWriter(path, frames.shape[1], fps, layout, encoding, **kwargs) as writer:
+        writer.write(frames)
+
+
+def load_motion(path):
+    ''' return: frames [frames x n_dims] float32, reader with fps and layout '''
+    reader = MotionReader(path)
+    return reader.read(), reader
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-motion', required=True)
+
+    arg = parser.parse_args()
+
+    reader = MotionReader(arg.motion)
+    print('[INFO] {}: {} frames x {} ({}), {} fps, {}{}'.format(
+        arg.motion, reader.n_frames, reader.n_dims, reader.layout, reader.fps, reader.encoding,
+        '' if reader.complete else ', still being written'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import os
+import numpy as np
+
+
+def create_session(path, n_threads=0):
+    ''' onnxruntime cpu session with every graph optimization enabled '''
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if n_threads > 0:
+        options.intra_op_num_threads = n_threads
+    return ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+
+class OnnxModel():
+    '''
+    base class of the models running on onnxruntime
+
+    note:
+        subclasses take the same numpy inputs as inference.inference
+        and return (motion_output, attentions)
+    '''
+
+    def infer(self, input_seq, pre_motion_seq, opt):
+        raise NotImplementedError
+
+
+class OnnxTransformer(OnnxModel):
+
+    def __init__(self, onnx_dir, n_threads=0):
+        self.session = create_session(os.path.join(onnx_dir, 'transformer.onnx'), n_threads)
+
+    def infer(self, input_seq, pre_motion_seq, opt):
+        dec_output = self.infer_batch(input_seq.T, pre_motion_seq.shape[-1])
+        # estimated frames only, as inference.estimated_frames
+        return dec_output[0, -opt.estimation_motions:], None
+
+    def infer_batch(self, src_seq, dim):
+        ''' src_seq: batch x seq (padded), return batch x 30 x dim '''
+        # same as torch inference, decoder starts from zero motion
+        trg_seq = np.zeros((src_seq.shape[0], 30, dim), dtype=np.float32)
+        dec_output, = self.session.run(['dec_output'], {'src_seq': src_seq.astype(np.int64), 'trg_seq': trg_seq})
+        return dec_output
+
+
+class OnnxSeq2Pose(OnnxModel):
+
+    def __init__(self, onnx_dir, n_threads=0):
+        self.encoder = create_session(os.path.join(onnx_dir, 'seq2pos_encoder.onnx'), n_threads)
+        self.decoder = create_session(os.path.join(onnx_dir, 'seq2pos_decoder.onnx'), n_threads)
+        # graphs exported with -skeleton have an extra pose output
+        self.decoder_outputs = ['motion_output', 'hidden', 'attn_weights']
+
+    def infer(self, input_seq, pre_motion_seq, opt):
+        enc_output, enc_hidden = self.encoder.run(None, {'src_seq': input_seq.astype(np.int64)})
+        hidden = enc_hidden[:opt.n_dec_layers]
+
+        target_length = opt.pre_motions + opt.estimation_motions
+        motion_output = np.zeros((opt.estimation_motions, pre_motion_seq.shape[-1]), dtype=np.float32)
+        attentions = np.zeros((target_length, len(input_seq)), dtype=np.float32)
+
+        decoder_input = None
+        for t in range(target_length):
+            if t < opt.pre_motions:
+                decoder_input = pre_motion_seq[t][np.newaxis].astype(np.float32)
+            decoder_input, hidden, attn_weight = self.decoder.run(self.decoder_outputs, {
+                                                        'motion_input': decoder_input,
+                                                        'last_hidden': hidden,
+                                                        'enc_output': enc_output})
+            if t >= opt.pre_motions:
+                motion_output[t - opt.pre_motions] = decoder_input[0]
+            attentions[t] = attn_weight[0, 0]
+
+        return motion_output, attentions
+
+
+def load_onnx_model(onnx_dir, opt, n_threads=0):
+    if opt.model == 'transformer':
+        return OnnxTransformer(onnx_dir, n_threads)
+    elif opt.model == 'seq2pos':
+        return OnnxSeq2Pose(onnx_dir, n_threads)
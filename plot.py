@@ -3,11 +3,14 @@ import numpy as np
 import argparse
 import seaborn as sns
 import pandas as pd
+import math
 
 from matplotlib import pyplot, transforms
 from matplotlib import animation, rc
+from matplotlib.collections import LineCollection
 
 from matplotlib.animation import FFMpegWriter
+from render import SKELETON
 from sklearn.metrics import confusion_matrix
 from sklearn.utils.multiclass import unique_labels
 
@@ -84,7 +87,7 @@ def display_pose(pose, degree=0, linewidth=5.0):
 
 
 def display_multi_poses(poses, col=10):
-    row = poses.shape[0] / col
+    row = int(math.ceil(poses.shape[0] / col))
     fig = plt.figure(figsize=(row, col))
     fig.subplots_adjust(hspace=0.4, wspace=0.5)
     
@@ -93,38 +96,84 @@ def display_multi_poses(poses, col=10):
         display_pose(poses[i-1], linewidth=3.0)
 
 
+def pose_segments(poses, degree=0):
+    '''
+    poses [N x 24] -> line segments [N x 7 x 2 (points) x 2 (x, y)]
+    '''
+    joints = np.asarray(poses, dtype=np.float64).reshape(len(poses), -1, 3)[:, :, :2]
+    if degree:
+        theta = np.deg2rad(degree)
+        rot = np.array([[np.cos(theta), np.sin(theta)], [-np.sin(theta), np.cos(theta)]])
+        joints = joints @ rot
+    return joints[:, SKELETON]
+
+
+def display_pose_grid(poses, col=10, degree=0, linewidth=3.0, spacing=None, ax=None):
+    '''
+    draw many poses into one axes with a single LineCollection
+
+    param:
+        poses - [N x 24] poses, pose i is drawn in cell (i // col, i % col)
+        spacing - distance between the cells, by default the largest pose extent
+    return:
+        the LineCollection
+    '''
+    segments = pose_segments(poses, degree)
+    n_poses = len(segments)
+
+    if spacing is None:
+        extent = np.nanmax(segments, axis=(1, 2)) - np.nanmin(segments, axis=(1, 2))
+        spacing = np.nanmax(extent) * 1.2 if n_poses else 1.0
+    index = np.arange(n_poses)
+    offsets = np.stack(((index % col) * spacing, -(index // col) * spacing), axis=1)
+    segments = segments + offsets[:, np.newaxis, np.newaxis, :]
+
+    # every pose uses the color cycle from the start, like one subplot per pose
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    colors = [colors[i % len(colors)] for i in range(len(SKELETON))] * n_poses
+
+    lines = LineCollection(segments.reshape(-1, 2, 2), colors=colors, linewidths=linewidth)
+    ax = ax or plt.gca()
+    ax.add_collection(lines)
+    ax.set_aspect('equal')
+    ax.autoscale_view()
+    ax.axis('off')
+    return lines
+
+
+def _read_loss_log(log_file):
+    # epoch,loss rows, later rows win when a resumed run logs an epoch again
+    log = pd.read_csv(log_file, skipinitialspace=True)
+    log = log.apply(pd.to_numeric, errors='coerce').dropna()
+    log['epoch'] = log['epoch'].astype(int)
+    return log.drop_duplicates('epoch', keep='last')
+
+
+def load_loss(log_train_file, log_vaild_file):
+    '''
+    return:
+        DataFrame of Epoch, Train_loss, Valid_loss, one row per trained epoch
+
+    note:
+        validation may skip epochs (-valid_interval, busy async validator) and
+        async results are logged out of order, the logs are joined on the epoch
+        and Valid_loss is NaN for epochs that were not validated
+    '''
+    loss_tr = _read_loss_log(log_train_file).rename(columns={'loss': 'Train_loss'})
+    loss_vf = _read_loss_log(log_vaild_file).rename(columns={'loss': 'Valid_loss'})
+
+    loss_df = loss_tr.merge(loss_vf, on='epoch', how='left').rename(columns={'epoch': 'Epoch'})
+    return loss_df.sort_values('Epoch').reset_index(drop=True)
+
+
 def display_loss(log_train_file, log_vaild_file):
-    loss_tr = []
-    loss_vf = []
-    with open(log_train_file, 'r') as log_tf, open(log_vaild_file, 'r') as log_vf:
-        for l in log_tf:
-            line = l.rstrip()
-            line = line.split(',')
-            val = line[1].strip()
-            try:
-                loss_tr.append(float(line[1].strip()))
-            except ValueError:
-                pass
-        for l in log_vf:
-            line = l.rstrip()
-            line = line.split(',')
-            val = line[1].strip()
-            try:
-                loss_vf.append(float(line[1].strip()))
-            except ValueError:
-                pass
-
-    loss_df = pd.DataFrame({
-        'Epoch': [i for i in range(len(loss_tr))],
-        'Train_loss': loss_tr,
-        'Valid_loss': loss_vf
-    })  
+    loss_df = load_loss(log_train_file, log_vaild_file)
     #print(loss_df.head())
     #exit(-1)
     plt.figure(figsize=(15, 9))
     sns.set_style('darkgrid')
     sns.lineplot(data=loss_df, x='Epoch', y='Train_loss', label='Train')
-    sns.lineplot(data=loss_df, x='Epoch', y='Valid_loss', label='Valid')
+    sns.lineplot(data=loss_df.dropna(), x='Epoch', y='Valid_loss', label='Valid')
     
 #    plt.plot(loss_tr, '-r', label='train')
  #   plt.plot(loss_vf, '-b', label='validation')
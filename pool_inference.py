@@ -0,0 +1,214 @@
+import argparse
+import os
+import queue
+import time
+import traceback
+import torch
+import torch.multiprocessing as mp
+
+from batch_inference import infer_sentences, load_sentences
+from cli import str2bool
+from inference import load_model
+
+
+def core_sets(n_workers, n_threads):
+    '''
+    split the cores this process may run on into one block per worker
+
+    note:
+        blocks wrap around when there are fewer cores than
+        n_workers * n_threads, workers then share cores
+    '''
+    if not hasattr(os, 'sched_getaffinity'):
+        # no affinity control on this platform (macos, windows)
+        return [None] * n_workers
+    cores = sorted(os.sched_getaffinity(0))
+    return [[cores[(w * n_threads + t) % len(cores)] for t in range(n_threads)]
+            for w in range(n_workers)]
+
+
+def _load(arg):
+    if arg['bundle']:
+        from bundle import load_bundle
+        return load_bundle(arg['bundle'])
+
+    data = torch.load(arg['data'])
+    model_info = torch.load(arg['checkpoint'], map_location='cpu')
+    opt = model_info['settings']
+    return load_model(model_info, data, torch.device('cpu')), opt, data
+
+
+def _worker(worker_id, cores, n_threads, load_arg, task_queue, result_queue):
+    try:
+        if cores is not None:
+            os.sched_setaffinity(0, cores)
+        torch.set_num_threads(n_threads)
+        model, opt, data = _load(load_arg)
+    except Exception:
+        result_queue.put(('error', worker_id, traceback.format_exc()))
+        return
+    result_queue.put(('ready', worker_id, None))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        call_id, index, sentence = task
+        try:
+            start = time.time()
+            with torch.no_grad():
+                motion = infer_sentences(model, [sentence], opt, data, decode=False)[0]
+            result_queue.put(('done', (call_id, index), (motion, worker_id, time.time() - start)))
+        except Exception:
+            result_queue.put(('failed', (call_id, index), traceback.format_exc()))
+
+
+class InferencePool():
+    '''
+    worker processes with their own model copy, sentences are taken from a shared queue
+
+    note:
+        every worker runs with a fixed number of intra-op threads and is pinned
+        to its own cores, so small batches do not fight over the same cores.
+        use as a context manager to stop the workers afterwards.
+    '''
+
+    def __init__(self, n_workers, n_threads=1, pin=True,
+                 data=None, checkpoint=None, bundle=None):
+        self.n_workers = n_workers
+        # results of an earlier map that gave up are recognized by their call id
+        self.call_id = 0
+        load_arg = {'data': data, 'checkpoint': checkpoint, 'bundle': bundle}
+        cores = core_sets(n_workers, n_threads) if pin else [None] * n_workers
+
+        # spawn, forked workers would inherit the thread pools of the parent
+        ctx = mp.get_context('spawn')
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.workers = [ctx.Process(target=_worker,
+                                    args=(w, cores[w], n_threads, load_arg,
+                                          self.task_queue, self.result_queue),
+                                    daemon=True)
+                        for w in range(n_workers)]
+        for worker in self.workers:
+            worker.start()
+
+        # wait until every model is loaded, start up is not part of the throughput
+        for _ in range(n_workers):
+            status, worker_id, message = self._get_result()
+            if status == 'error':
+                self.close()
+                raise RuntimeError('worker {} failed to start:\n{}'.format(worker_id, message))
+
+    def _get_result(self, poll=1.0):
+        # a worker that died takes its sentence with it, do not wait forever
+        while True:
+            try:
+                return self.result_queue.get(timeout=poll)
+            except queue.Empty:
+                dead = [w for w, worker in enumerate(self.workers) if not worker.is_alive()]
+                if dead:
+                    raise RuntimeError('worker {} exited with code {}'.format(
+                                            dead[0], self.workers[dead[0]].exitcode))
+
+    def map(self, sentences):
+        '''
+        return:
+            list of pca motions [frames x dim] in the order of the sentences,
+            list of (worker id, seconds) per sentence
+        note:
+            all results of the call are collected before a failed sentence is reported
+        '''
+        self.call_id += 1
+        for index, sentence in enumerate(sentences):
+            self.task_queue.put((self.call_id, index, sentence))
+
+        motions = [None] * len(sentences)
+        stats = [None] * len(sentences)
+        failed = []
+        n_done = 0
+        while n_done < len(sentences):
+            status, (call_id, index), result = self._get_result()
+            if call_id != self.call_id:
+                continue
+            n_done += 1
+            if status == 'failed':
+                failed.append((index, result))
+                continue
+            motions[index], worker_id, elapsed = result
+            stats[index] = (worker_id, elapsed)
+
+        if failed:
+            index, message = failed[0]
+            raise RuntimeError('{} sentences failed, sentence {}:\n{}'.format(len(failed), index, message))
+        return motions, stats
+
+    def close(self):
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def scaling_report(sentences, worker_counts, n_threads, pin, **load_arg):
+    '''
+    throughput of the pool for every number of workers
+
+    return:
+        list of dictionaries with workers, sentences/s, words/s, speedup and efficiency
+    '''
+    n_words = sum(len(sentence.split()) for sentence in sentences)
+    report = []
+    for n_workers in worker_counts:
+        with InferencePool(n_workers, n_threads, pin, **load_arg) as pool:
+            # one warm up pass per worker
+            pool.map(sentences[:n_workers])
+            start = time.time()
+            pool.map(sentences)
+            elapsed = time.time() - start
+
+        throughput = len(sentences) / elapsed
+        speedup = throughput / report[0]['sentences_per_sec'] * report[0]['workers'] if report else n_workers
+        report.append({
+            'workers': n_workers,
+            'sentences_per_sec': throughput,
+            'words_per_sec': n_words / elapsed,
+            'speedup': speedup,
+            'efficiency': speedup / n_workers
+        })
+        print('[INFO] workers {:3d}  {:8.2f} sentences/s  {:9.1f} words/s  speedup {:5.2f}  efficiency {:.0%}'.format(
+            n_workers, throughput, n_words / elapsed, speedup, speedup / n_workers))
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    parser.add_argument('-checkpoint', default='./trained_model/transformer.chkpt')
+    parser.add_argument('-bundle', default=None) # use an inference bundle instead of -data / -checkpoint
+    parser.add_argument('-sentences', default='./data/sentences.txt')
+    parser.add_argument('-n_workers', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('-n_threads', type=int, default=1) # intra-op threads per worker
+    parser.add_argument('-pin', type=str2bool, default=True) # pin workers to their own cores
+
+    arg = parser.parse_args()
+
+    sentences = load_sentences(arg.sentences)
+    print('[INFO] sentences: {}, cores: {}'.format(len(sentences), os.cpu_count()))
+
+    scaling_report(sentences, arg.n_workers, arg.n_threads, arg.pin,
+                   data=arg.data, checkpoint=arg.checkpoint, bundle=arg.bundle)
+
+
+if __name__ == '__main__':
+    main()
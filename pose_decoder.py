@@ -0,0 +1,35 @@
+import numpy as np
+import torch
+import torch.nn as nn
+
+
+class PoseDecoder(nn.Module):
+    '''
+    pca inverse transform as a layer
+
+    note:
+        turns model outputs [..., n_components] into skeleton poses [..., 24]
+        with a single matmul, works with sklearn PCA and bundle PCAParams
+    '''
+
+    def __init__(self, components, mean):
+        super().__init__()
+        self.register_buffer('components', torch.as_tensor(components, dtype=torch.float))
+        self.register_buffer('mean', torch.as_tensor(mean, dtype=torch.float))
+
+    @classmethod
+    def from_pca(cls, pca):
+        components = np.asarray(pca.components_)
+        if getattr(pca, 'whiten', False):
+            # fold the whitening scale into the components
+            components = components * np.sqrt(pca.explained_variance_)[:, np.newaxis]
+        return cls(components, pca.mean_)
+
+    def forward(self, motion):
+        return torch.matmul(motion, self.components) + self.mean
+
+    def decode(self, motion):
+        ''' numpy in, numpy out '''
+        motion = torch.as_tensor(np.asarray(motion), dtype=torch.float, device=self.mean.device)
+        with torch.no_grad():
+            return self(motion).cpu().numpy()
@@ -8,9 +8,11 @@ import matplotlib.pyplot as plt
 import random
 
 from tqdm import tqdm
-from plot import display_multi_poses, display_pose
+from cli import str2bool
+from plot import display_pose_grid, display_pose
 from sklearn.decomposition import PCA
 from sklearn import preprocessing
+from embedding import EMB_DTYPES, compact_emb_table, prune_vocab
 
 def loadpickle(path, data_size):
     '''
@@ -364,13 +366,17 @@ def build_emb_table(emb_path, target_vocab):
     dim = vects.shape[1]
 
     emb_tb = np.zeros((len(target_vocab), dim))
+    missing = []
     for k, v in target_vocab.items():
         try:
             emb_tb[v] = vects[word2idx[k]]
         except KeyError:
             emb_tb[v] = np.random.normal(scale=0.6, size=(dim, )) 
+            missing.append(k)
 
-    return emb_tb
+    print('[INFO] Words without a pretrained vector: {}'.format(len(missing)))
+
+    return emb_tb, missing
 
 
 def main():
@@ -387,6 +393,8 @@ def main():
     parser.add_argument('-min_word_count', type=int, default=0)
     parser.add_argument('-pca_components', type=int, default=10)
     parser.add_argument('-emb_src', default="./data/glove.6B.300d.txt")
+    parser.add_argument('-emb_dtype', default='float64', choices=list(EMB_DTYPES))
+    parser.add_argument('-prune_vocab', type=str2bool, default=False)
     
     parser.add_argument('-mode', default='preprocessing')
 
@@ -407,7 +415,7 @@ def main():
         sample = np.concatenate((m_0, m_1, m_2, m_3), axis=0)
     
         trans_pos = pca.inverse_transform(sample)
-        display_multi_poses(trans_pos)
+        display_pose_grid(trans_pos)
         plt.show()
         exit(-1)
     
@@ -418,12 +426,8 @@ def main():
         print("count: {}".format(len(poses)))
         print("sh_len:{}".format(get_distance(p[6], p[7], p[3], p[4])))
         # poses = random.sample(list(poses), k=30)
-        if len(poses) < 30:
-            poses = poses[:]
-            display_multi_poses(np.array(poses), col=1)
-        else:
-            poses = poses[:30]
-            display_multi_poses(np.array(poses), col=10)
+        # one pass for every pose, the grid is not limited to 30 samples anymore
+        display_pose_grid(np.array(poses), col=min(len(poses), int(math.ceil(math.sqrt(len(poses))))))
         plt.show()
         exit(-1)
 
@@ -438,12 +442,23 @@ def main():
     word2idx = build_vocab_idx(train_src_insts, opt.min_word_count)
     
     print('[INFO] Build embedding table.')
-    emb_tb = build_emb_table(opt.emb_src, word2idx)
+    emb_tb, missing_words = build_emb_table(opt.emb_src, word2idx)
 
     print('[INFO] Convert source word instance into seq for word index.')
     train_src_insts = convert_instance_to_idx_seq(train_src_insts, word2idx)
     valid_src_insts = convert_instance_to_idx_seq(valid_src_insts, word2idx)
 
+    if opt.prune_vocab:
+        # the vocabulary comes from train, so every row is used. the rows of words
+        # without a pretrained vector are random, these words become UNK
+        print('[INFO] Prune vocabulary rows without a pretrained vector.')
+        word2idx, emb_tb, (train_src_insts, valid_src_insts) = prune_vocab(
+                                    word2idx, emb_tb, [train_src_insts, valid_src_insts], missing_words)
+
+    if opt.emb_dtype != 'float64':
+        print('[INFO] Store embedding table as {}.'.format(opt.emb_dtype))
+        emb_tb = compact_emb_table(emb_tb, opt.emb_dtype)
+
     print('[INFO] normalize target pose instance')
     norm_tr_tgt, tr_l = tgt_insts_normalize(train_tgt_insts)
     norm_val_tgt, val_l = tgt_insts_normalize(valid_tgt_insts)
@@ -0,0 +1,114 @@
+import argparse
+import io
+import time
+import torch
+import torch.nn as nn
+import numpy as np
+
+from inference import load_model, infer_from_words, normalized_string
+from embedding import strip_embedding
+
+
+def quantize_model(model):
+    '''
+    apply dynamic int8 quantization to the linear and gru layers
+
+    note:
+        weights are quantized ahead of time, activations are quantized on the fly.
+        dynamic quantization only runs on cpu.
+    '''
+    model.eval()
+    return torch.quantization.quantize_dynamic(
+                model.cpu(), {nn.Linear, nn.GRU}, dtype=torch.qint8)
+
+
+def save_quantized(model, model_info, path):
+    state = model.state_dict()
+    if model_info.get('shared_emb'):
+        state = strip_embedding(state)
+    checkpoint = {
+        'model': state,
+        'settings': model_info['settings'],
+        'epoch': model_info.get('epoch'),
+        'quantized': 'dynamic_qint8',
+        'shared_emb': model_info.get('shared_emb', False)
+    }
+    torch.save(checkpoint, path)
+    print('[INFO] Quantized checkpoint saved: {}'.format(path))
+
+
+def state_size(model):
+    ''' return serialized size of the model state in bytes '''
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell()
+
+
+def compare_models(fp32_model, int8_model, word_list, opt, data):
+    '''
+    run both models on the same utterances
+
+    return:
+        mean squared error and max abs error of the motion (pca space),
+        mean latency per window of each model in seconds
+    '''
+    sq_err = []
+    abs_err = []
+    latency = {'fp32': [], 'int8': []}
+    for words in word_list:
+        motions = {}
+        for name, model in (('fp32', fp32_model), ('int8', int8_model)):
+            start = time.time()
+            outputs = infer_from_words(model, words, opt, data)
+            latency[name].append((time.time() - start) / len(outputs))
+            motions[name] = np.concatenate([np.asarray(out.out_motion) for out in outputs])
+
+        diff = motions['fp32'] - motions['int8']
+        sq_err.append(np.mean(diff ** 2))
+        abs_err.append(np.max(np.abs(diff)))
+
+    return np.mean(sq_err), np.max(abs_err), np.mean(latency['fp32']), np.mean(latency['int8'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    parser.add_argument('-checkpoint', default='./trained_model/transformer.chkpt')
+    parser.add_argument('-save_model', default='./trained_model/transformer_int8.chkpt')
+    parser.add_argument('-n_samples', type=int, default=20)
+    parser.add_argument('-n_threads', type=int, default=0)
+
+    arg = parser.parse_args()
+
+    if arg.n_threads > 0:
+        torch.set_num_threads(arg.n_threads)
+
+    device = torch.device('cpu')
+    data = torch.load(arg.data)
+    model_info = torch.load(arg.checkpoint, map_location=device)
+    opt = model_info['settings']
+
+    fp32_model = load_model(model_info, data, device)
+    int8_model = quantize_model(load_model(model_info, data, device))
+    save_quantized(int8_model, model_info, arg.save_model)
+
+    # reload to make sure the saved checkpoint is usable as is
+    int8_model = load_model(torch.load(arg.save_model, map_location=device), data, device)
+
+    # utterances for the comparison come from the validation set
+    idx2word = {v: k for k, v in data['dict'].items()}
+    word_list = [[idx2word[i] for i in src] for src in data['valid']['src'][:arg.n_samples]]
+    word_list.append(normalized_string("look at the small world in front of me ,").split(' '))
+
+    mse, max_err, fp32_lat, int8_lat = compare_models(fp32_model, int8_model, word_list, opt, data)
+
+    print('[INFO] state size: fp32 {:.2f} MB, int8 {:.2f} MB'.format(
+                        state_size(fp32_model) / 2**20, state_size(int8_model) / 2**20))
+    print('[INFO] latency per window: fp32 {:.2f} ms, int8 {:.2f} ms (x{:.2f})'.format(
+                        fp32_lat * 1000, int8_lat * 1000, fp32_lat / int8_lat))
+    print('[INFO] motion error vs fp32: mse {:.6f}, max abs {:.6f}'.format(mse, max_err))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import matplotlib
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+# joint pairs of the 8 joint skeleton, same lines as Plot.animate_frame,
+# pose_segments (plot.py) draws the grids with them too
+SKELETON = [(0, 1), (1, 2), (2, 3), (4, 3), (1, 5), (5, 6), (7, 6)]
+
+
+class SkeletonRenderer():
+    '''
+    draw skeleton poses straight into rgb frame buffers and pipe them to ffmpeg
+
+    param:
+        titles - one title per panel, several titles give a row of panels
+                 that are drawn from [panels x 24] poses
+        caption - optional text below the panels
+    note:
+        the empty axes are drawn once by matplotlib, so frame size, axes,
+        ticks, line colors and widths match the videos of Plot.save.
+        lines are anti-aliased by their pixel coverage and clipped to the axes.
+    '''
+
+    def __init__(self, x_lim=(-7, 7), y_lim=(-7, 7), linewidth=5, figsize=None, dpi=None,
+                 titles=None, caption=None):
+        # kept to build the same renderer in worker processes
+        self.config = dict(x_lim=x_lim, y_lim=y_lim, linewidth=linewidth, figsize=figsize, dpi=dpi,
+                           titles=titles, caption=caption)
+        fig = Figure(figsize=figsize or matplotlib.rcParams['figure.figsize'],
+                     dpi=dpi or matplotlib.rcParams['figure.dpi'])
+        canvas = FigureCanvasAgg(fig)
+        titles = titles or [None]
+        axes = [fig.add_subplot(1, len(titles), i + 1, xlim=x_lim, ylim=y_lim, title=title)
+                for i, title in enumerate(titles)]
+        if caption:
+            fig.text(0.5, 0.02, caption, ha='center', va='bottom', wrap=True)
+        canvas.draw()
+
+        background = np.asarray(canvas.buffer_rgba())[:, :, :3]
+        height, width = background.shape[:2]
+        # yuv420p needs an even frame size
+        self.background = background[:height // 2 * 2, :width // 2 * 2].copy()
+        self.height, self.width = self.background.shape[:2]
+
+        self.panels = []
+        for ax in axes:
+            # data -> pixel transform, pixel rows count from the top
+            (x0, y0), (x1, y1) = ax.transData.transform([(0, 0), (1, 1)])
+            scale = np.array([x1 - x0, -(y1 - y0)])
+            offset = np.array([x0, height - y0])
+
+            bbox = ax.get_window_extent()
+            clip = (max(int(np.floor(bbox.x0)), 0), min(int(np.ceil(bbox.x1)), self.width),
+                    max(int(np.floor(height - bbox.y1)), 0), min(int(np.ceil(height - bbox.y0)), self.height))
+            self.panels.append((scale, offset, clip))
+
+        # linewidth in points
+        self.half_width = linewidth * fig.dpi / 72 / 2
+        colors = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+        self.colors = [np.array(matplotlib.colors.to_rgb(colors[i % len(colors)])) * 255
+                       for i in range(len(SKELETON))]
+
+    def to_pixel(self, pose, panel=0):
+        ''' [24] pose (x, y, z per joint) -> [8 x 2] pixel coordinates '''
+        scale, offset, _ = self.panels[panel]
+        joints = np.asarray(pose, dtype=np.float64).reshape(-1, 3)[:, :2]
+        return joints * scale + offset
+
+    def _draw_line(self, frame, p, q, color, clip):
+        hw = self.half_width
+        left, right, top, bottom = clip
+        x_min = max(int(np.floor(min(p[0], q[0]) - hw - 1)), left)
+        x_max = min(int(np.ceil(max(p[0], q[0]) + hw + 1)), right)
+        y_min = max(int(np.floor(min(p[1], q[1]) - hw - 1)), top)
+        y_max = min(int(np.ceil(max(p[1], q[1]) + hw + 1)), bottom)
+        if x_min >= x_max or y_min >= y_max:
+            return
+
+        # pixel centers of the bounding box
+        xs = np.arange(x_min, x_max) + 0.5
+        ys = np.arange(y_min, y_max)[:, np.newaxis] + 0.5
+
+        d = q - p
+        length = np.hypot(*d)
+        u = d / length if length > 0 else np.array([1.0, 0.0])
+        # position along the line and distance across it
+        along = (xs - p[0]) * u[0] + (ys - p[1]) * u[1]
+        across = np.abs((xs - p[0]) * u[1] - (ys - p[1]) * u[0])
+
+        # projecting caps like matplotlib lines, one pixel wide edge ramp
+        outside = np.maximum(-along, along - length)
+        coverage = np.clip(hw + 0.5 - across, 0, 1) * np.clip(hw + 0.5 - outside, 0, 1)
+
+        region = frame[y_min:y_max, x_min:x_max]
+        alpha = coverage[:, :, np.newaxis]
+        region[:] = region * (1 - alpha) + color * alpha
+
+    def render_frame(self, pose):
+        '''
+        pose: [24] or [panels x 24], a nan pose leaves its panel empty
+        return: height x width x 3 uint8 frame
+        '''
+        frame = self.background.astype(np.float32)
+        poses = np.asarray(pose).reshape(len(self.panels), -1)
+        for panel, pose in enumerate(poses):
+            joints = self.to_pixel(pose, panel)
+            for (a, b), color in zip(SKELETON, self.colors):
+                # matplotlib leaves out lines with missing points
+                if np.isfinite(joints[[a, b]]).all():
+                    self._draw_line(frame, joints[a], joints[b], color, self.panels[panel][2])
+        return np.round(frame).astype(np.uint8)
+
+    def frames(self, poses):
+        for pose in poses:
+            yield self.render_frame(pose)
+
+    def save(self, poses, name, fps=18, bitrate=1800, codec='libx264', verbose=True):
+        '''
+        encode poses [frames x 24] (or [frames x panels x 24]) into a video
+        with the settings of Plot.save
+        '''
+        cmd = [matplotlib.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-vcodec', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', '{}x{}'.format(self.width, self.height), '-r', str(fps), '-i', '-',
+               '-vcodec', codec, '-pix_fmt', 'yuv420p', '-b:v', '{}k'.format(bitrate),
+               '-metadata', 'artist=Me', name]
+
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        try:
+            for frame in self.frames(poses):
+                proc.stdin.write(frame.tobytes())
+        finally:
+            proc.stdin.close()
+            proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError('ffmpeg exited with code {}'.format(proc.returncode))
+        if verbose:
+            print("[INFO] {} file saved.".format(name))
+
+    def save_parallel(self, poses, name, n_workers=None, fps=18, bitrate=1800, codec='libx264'):
+        '''
+        split the frames into one range per worker, render every range in its own
+        process and join the segments without re-encoding (ffmpeg concat)
+        '''
+        n_workers = n_workers or os.cpu_count()
+        poses = np.asarray(poses)
+        ranges = np.array_split(np.arange(len(poses)), n_workers)
+        ranges = [r for r in ranges if len(r) > 0]
+
+        tmp_dir = tempfile.mkdtemp(prefix='render_')
+        try:
+            segments = [os.path.join(tmp_dir, 'segment_{:04d}.mp4'.format(i)) for i in range(len(ranges))]
+            jobs = [(self.config, poses[r], segment, fps, bitrate, codec) for r, segment in zip(ranges, segments)]
+            # spawn, the parent may hold torch thread pools that do not survive a fork
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context('spawn')) as executor:
+                list(executor.map(_render_job, jobs))
+
+            list_file = os.path.join(tmp_dir, 'segments.txt')
+            with open(list_file, 'w') as f:
+                for segment in segments:
+                    f.write("file '{}'\n".format(segment))
+            _ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_file, '-c', 'copy', name])
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        print("[INFO] {} file saved.".format(name))
+
+
+def _ffmpeg(args):
+    cmd = [matplotlib.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error'] + args
+    if subprocess.call(cmd) != 0:
+        raise RuntimeError('ffmpeg failed: {}'.format(' '.join(cmd)))
+
+
+def _render_job(job):
+    config, poses, name, fps, bitrate, codec = job
+    SkeletonRenderer(**config).save(poses, name, fps, bitrate, codec, verbose=False)
+    return name
+
+
+def render_many(pose_list, names, n_workers=None, fps=18, configs=None):
+    '''
+    render many clips, one process renders one whole clip at a time
+
+    param:
+        configs - optional SkeletonRenderer arguments per clip
+    '''
+    configs = configs or [{}] * len(names)
+    jobs = [(config, np.asarray(poses), name, fps, 1800, 'libx264')
+            for poses, name, config in zip(pose_list, names, configs) if len(poses) > 0]
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context('spawn')) as executor:
+        for name in executor.map(_render_job, jobs):
+            print("[INFO] {} file saved.".format(name))
+
+
+def main():
+    import torch
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-poses', default='./videos/poses.pickle') # output of batch_inference.py
+    parser.add_argument('-save_dir', default='./videos/')
+    parser.add_argument('-n_workers', type=int, default=0) # 0: one per core
+    parser.add_argument('-fps', type=int, default=18)
+
+    arg = parser.parse_args()
+
+    result = torch.load(arg.poses)
+    names = [os.path.join(arg.save_dir, 'clip_{:04d}.mp4'.format(i)) for i in range(len(result['poses']))]
+    render_many(result['poses'], names, arg.n_workers or None, fps=arg.fps)
+
+
+if __name__ == '__main__':
+    main()
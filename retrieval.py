@@ -0,0 +1,190 @@
+import argparse
+import os
+import time
+import torch
+import numpy as np
+
+from argparse import Namespace
+from cli import str2bool
+from embedding import emb_tensor
+from inference import normalized_string, split_windows
+
+import constant as Constant
+
+
+# tokens left out of the mean word embedding of a window
+SPECIAL = [Constant.PAD, Constant.UNK, Constant.BOS, Constant.EOS]
+
+
+def window_opt(pre_motions, estimation_motions):
+    # windows are split like the ones of the models
+    return Namespace(model='retrieval', pre_motions=pre_motions, estimation_motions=estimation_motions)
+
+
+def window_keys(windows, word2idx, emb):
+    ''' list of word windows -> [windows x emb dim] unit length mean word embeddings '''
+    keys = np.zeros((len(windows), emb.shape[1]), dtype=np.float32)
+    for i, words in enumerate(windows):
+        idx = [word2idx.get(w, Constant.UNK) for w in words]
+        idx = [j for j in idx if j not in SPECIAL]
+        if idx:
+            keys[i] = emb[idx].mean(0)
+    norm = np.linalg.norm(keys, axis=1, keepdims=True)
+    return keys / np.maximum(norm, 1e-8)
+
+
+class MotionIndex():
+    '''
+    nearest neighbour index of training motion windows
+
+    every training clip is split into the word windows of split_windows, the key of
+    a window is the normalized mean embedding of its words and the value is the pca
+    motion of the estimated frames (estimation_motions frames per window)
+
+    param:
+        keys - [windows x emb dim] unit length keys
+        motions - [windows x estimation_motions x pca dim]
+        clips, starts - training clip and first frame of every window
+    note:
+        the search is one brute force matmul, kd-trees do not beat it
+        on 300 dimensional embeddings
+    '''
+
+    def __init__(self, keys, motions, clips, starts, data, pre_motions=10, estimation_motions=20):
+        self.keys = np.ascontiguousarray(keys, dtype=np.float32)
+        self.motions = np.asarray(motions, dtype=np.float32)
+        self.clips = np.asarray(clips)
+        self.starts = np.asarray(starts)
+        self.word2idx = data['dict']
+        self.emb = emb_tensor(data['emb_tbl']).float().numpy()
+        self.opt = window_opt(pre_motions, estimation_motions)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, windows, k=5):
+        '''
+        return:
+            [windows x k] indices of the closest stored windows, best first,
+            [windows x k] cosine similarities
+        '''
+        k = min(k, len(self))
+        scores = window_keys(windows, self.word2idx, self.emb) @ self.keys.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def generate(self, words, sp_duration=None, k=5):
+        '''
+        pca motion [frames x dim] of an utterance made of retrieved windows
+
+        note:
+            of the k closest windows the one starting nearest to the end of
+            the previous window is taken, this keeps the seams small
+        '''
+        windows, _ = split_windows(words, self.opt, sp_duration)
+        neighbours, _ = self.search(windows, k)
+
+        motion = [self.motions[neighbours[0, 0]]]
+        for candidates in neighbours[1:]:
+            gap = np.linalg.norm(self.motions[candidates, 0] - motion[-1][-1], axis=1)
+            motion.append(self.motions[candidates[np.argmin(gap)]])
+        return np.concatenate(motion)
+
+    def save(self, path):
+        np.savez(path, keys=self.keys, motions=self.motions, clips=self.clips, starts=self.starts,
+                 pre_motions=self.opt.pre_motions, estimation_motions=self.opt.estimation_motions)
+        print('[INFO] retrieval index saved: {} ({} windows)'.format(path, len(self)))
+
+    @classmethod
+    def load(cls, path, data):
+        ''' data - the data file the index was built from, for the vocabulary and embedding '''
+        f = np.load(path)
+        return cls(f['keys'], f['motions'], f['clips'], f['starts'], data,
+                   int(f['pre_motions']), int(f['estimation_motions']))
+
+
+def build_index(data, pre_motions=10, estimation_motions=20, split='train'):
+    '''
+    index the motion windows of a split (run_PCA_train_tgt outputs for train)
+
+    note:
+        windows are timed to the clip length (12 fps) like the evaluation,
+        window i covers frames [i * estimation_motions, (i + 1) * estimation_motions)
+    '''
+    idx2word = {idx: word for word, idx in data['dict'].items()}
+    opt = window_opt(pre_motions, estimation_motions)
+
+    windows, motions, clips, starts = [], [], [], []
+    for clip, (src, tgt) in enumerate(zip(data[split]['src'], data[split]['tgt'])):
+        words = [idx2word.get(idx, Constant.UNK_WORD) for idx in src]
+        for i, window in enumerate(split_windows(words, opt, len(tgt) / 12)[0]):
+            start = i * estimation_motions
+            # the last window of a clip may run past its motion
+            if start + estimation_motions > len(tgt):
+                break
+            windows.append(window)
+            motions.append(tgt[start:start + estimation_motions])
+            clips.append(clip)
+            starts.append(start)
+
+    keys = window_keys(windows, data['dict'], emb_tensor(data['emb_tbl']).float().numpy())
+    return MotionIndex(keys, np.stack(motions), clips, starts, data, pre_motions, estimation_motions)
+
+
+def retrieve_sentences(index, sentences, k=5):
+    ''' pca motion of raw sentences, same output as infer_sentences(decode=False) '''
+    motions = []
+    for sentence in sentences:
+        words = normalized_string(sentence).split(' ')
+        if words == ['']:
+            motions.append(np.zeros((0, index.motions.shape[2])))
+        else:
+            motions.append(index.generate(words, k=k))
+    return motions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    parser.add_argument('-index', default='./trained_model/retrieval.npz')
+    parser.add_argument('-rebuild', type=str2bool, default=False)
+    parser.add_argument('-pre_motions', type=int, default=10)
+    parser.add_argument('-estimation_motions', type=int, default=20)
+    parser.add_argument('-sentence', default=None) # show the closest training windows of every word window
+    parser.add_argument('-k', type=int, default=5)
+
+    arg = parser.parse_args()
+
+    data = torch.load(arg.data)
+    if arg.rebuild or not os.path.exists(arg.index):
+        start = time.time()
+        index = build_index(data, arg.pre_motions, arg.estimation_motions)
+        print('[INFO] indexed {} training windows in {:.2f}s'.format(len(index), time.time() - start))
+        index.save(arg.index)
+    else:
+        index = MotionIndex.load(arg.index, data)
+
+    if arg.sentence:
+        words = normalized_string(arg.sentence).split(' ')
+        windows, _ = split_windows(words, index.opt)
+        start = time.time()
+        neighbours, scores = index.search(windows, arg.k)
+        elapse = time.time() - start
+
+        idx2word = {idx: word for word, idx in data['dict'].items()}
+        for window, found, score in zip(windows, neighbours, scores):
+            print('[ {} ]'.format(' '.join(window)))
+            for n, s in zip(found, score):
+                clip, first = index.clips[n], index.starts[n]
+                src = data['train']['src'][clip]
+                print('\t{:.3f}  clip {:5d} frames {:4d}-{:4d}  {}'.format(
+                    s, clip, first, first + index.opt.estimation_motions,
+                    ' '.join(idx2word.get(idx, Constant.UNK_WORD) for idx in src)[:80]))
+        print('[INFO] {} windows searched in {:.3f} ms'.format(len(windows), elapse * 1000))
+
+
+if __name__ == '__main__':
+    main()
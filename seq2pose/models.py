@@ -5,6 +5,8 @@ import numpy as np
 import math
 import random
 
+from embedding import emb_tensor
+
 class EncoderRNN(nn.Module):
 
     def __init__(self, emb_matrix, input_size, hidden_size, bidirectional, n_layers=1, dropout=0.1):
@@ -18,7 +20,7 @@ class EncoderRNN(nn.Module):
         self.dropout = dropout       
         
         # lookup table from pre-trained embedding matrix (glove)
-        emb_matrix = torch.from_numpy(emb_matrix).float()  
+        emb_matrix = emb_tensor(emb_matrix)
         self.embedding = nn.Embedding.from_pretrained(emb_matrix)
         # do not update the embedding layer
         self.embedding.weight.requires_grad = False
@@ -29,8 +31,9 @@ class EncoderRNN(nn.Module):
 
 
     def forward(self, input_seqs, input_lengths, hidden=None, infer=False):
-        embedded = self.embedding(input_seqs)
-        packed = torch.nn.utils.rnn.pack_padded_sequence(embedded, input_lengths)
+        # compact (fp16 / bf16) tables are looked up first and cast afterwards
+        embedded = self.embedding(input_seqs).float()
+        packed = torch.nn.utils.rnn.pack_padded_sequence(embedded, input_lengths, enforce_sorted=False)
         output, hidden = self.gru(packed, hidden)
         output, _ = torch.nn.utils.rnn.pad_packed_sequence(output) # unpacked, backed to padded
 
@@ -50,12 +53,14 @@ class Attn(nn.Module):
         stdv = 1. / math.sqrt(self.v.size(0))
         self.v.data.normal_(mean=0, std=stdv)
 
-    def forward(self, hidden, encoder_outputs):
+    def forward(self, hidden, encoder_outputs, mask=None):
         '''
         :param hidden:
             previous hidden state of the decoder, in shape (layers*directions,B,H)
         :param encoder_outputs:
             encoder outputs from Encoder, in shape (T,B,H)
+        :param mask:
+            optional padding mask in shape (B,T), False for padded steps
         :return
             attention energies in shape (B,T)
         '''
@@ -64,6 +69,8 @@ class Attn(nn.Module):
         H = hidden.repeat(max_len, 1, 1).transpose(0, 1)
         encoder_outputs = encoder_outputs.transpose(0, 1)  # [B*T*H]
         attn_energies = self.score(H, encoder_outputs)  # compute attention score
+        if mask is not None:
+            attn_energies = attn_energies.masked_fill(~mask, float('-inf'))
         return F.softmax(attn_energies, dim=1).unsqueeze(1)  # normalize with softmax
 
     def score(self, hidden, encoder_outputs):
@@ -113,7 +120,7 @@ class BahdanauAttnDecoderRNN(nn.Module):
         for param in self.attn.parameters():
             param.requires_grad = False
 
-    def forward(self, motion_input, last_hidden, encoder_outputs):
+    def forward(self, motion_input, last_hidden, encoder_outputs, mask=None):
         '''
         :param motion_input:
             motion input for current time step, in shape [batch x dim]
@@ -121,6 +128,8 @@ class BahdanauAttnDecoderRNN(nn.Module):
             last hidden state of the decoder, in shape [layers x batch x hidden_size]
         :param encoder_outputs:
             encoder outputs in shape [steps x batch x hidden_size]
+        :param mask:
+            optional padding mask of the encoder outputs in shape [batch x steps]
         :return
             decoder output
         Note: we run this one step at a time i.e. you should use a outer loop
@@ -137,7 +146,7 @@ class BahdanauAttnDecoderRNN(nn.Module):
             motion_input = motion_input.view(1, motion_input.size(0), -1)  # [1 x batch x dim]
 
         # attention
-        attn_weights = self.attn(last_hidden[-1], encoder_outputs)  # [batch x 1 x T]
+        attn_weights = self.attn(last_hidden[-1], encoder_outputs, mask)  # [batch x 1 x T]
         context = attn_weights.bmm(encoder_outputs.transpose(0, 1))  # [batch x 1 x attn_size]
         context = context.transpose(0, 1)  # [1 x batch x attn_size]
 
@@ -211,6 +220,46 @@ class Seq2Pose(nn.Module):
         ans_p = tgt_seq[-opt.estimation_motions:].transpose(0,1).float()
 
         return suc_p, ans_p
-        
 
+    def generate(self, src_seq, src_len, pre_motion_seq, n_pre, n_est, return_attention=False,
+                 include_seed_step=False):
+        '''
+        autoregressive motion generation, the whole loop stays on the model device
+
+        param:
+            src_seq - word indices in shape [seq x batch], padded
+            src_len - lengths of the word sequences (with SOS and EOS)
+            pre_motion_seq - seed motion in shape [n_pre (or more) x batch x dim]
+            n_pre - number of seed frames fed to the decoder
+            n_est - number of frames to generate
+            return_attention - also collect the attention weights of every step
+            include_seed_step - start with the output of the step fed the last seed
+                                frame, i.e. the frames forward() is trained on
+                                (one step earlier than inference)
+        return:
+            motion [n_est x batch x dim], attention [steps x batch x seq] or None
+        '''
+        enc_out, enc_hid = self.encoder(src_seq, src_len)
+        dec_hid = enc_hid[:self.decoder.n_layers]
 
+        # padded words must not take attention away from the real ones
+        lengths = torch.as_tensor(src_len, device=enc_out.device)
+        mask = torch.arange(enc_out.size(0), device=enc_out.device).unsqueeze(0) < lengths.unsqueeze(1)
+
+        first = n_pre - 1 if include_seed_step else n_pre
+        batch_size = src_seq.size(1)
+        outputs = enc_out.new_zeros(n_est, batch_size, self.decoder.output_size)
+        attentions = None
+        if return_attention:
+            attentions = enc_out.new_zeros(first + n_est, batch_size, enc_out.size(0))
+
+        dec_out = None
+        for t in range(first + n_est):
+            dec_in = pre_motion_seq[t] if t < n_pre else dec_out
+            dec_out, dec_hid, attn_weight = self.decoder(dec_in.float(), dec_hid, enc_out, mask)
+            if t >= first:
+                outputs[t - first] = dec_out
+            if return_attention:
+                attentions[t] = attn_weight.squeeze(1)
+
+        return outputs, attentions
@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import json
+import time
+import torch
+import numpy as np
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from inference import load_model
+from batch_inference import infer_sentences
+from pose_decoder import PoseDecoder
+from retrieval import MotionIndex, retrieve_sentences
+from smoothing import add_filter_args, filter_from_args, smooth_clip
+
+
+class MicroBatcher():
+    '''
+    merge concurrent requests into one inference call
+
+    note:
+        the first queued sentence opens a batch, the batch runs when it holds
+        max_batch sentences or max_wait seconds have passed.
+        with a fallback retrieval index, sentences that arrive while max_queue
+        sentences are already waiting get retrieved motion right away
+    '''
+
+    def __init__(self, model, opt, data, max_batch=32, max_wait=0.01, batch_size=64, n_workers=1,
+                 fallback=None, max_queue=256):
+        self.model = model
+        self.opt = opt
+        self.data = data
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batch_size = batch_size
+        self.n_workers = n_workers
+        self.fallback = fallback
+        self.max_queue = max_queue
+
+        self.queue = asyncio.Queue()
+        # one inference call at a time, the model threads do the parallel work
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        # metrics
+        self.latency = deque(maxlen=1000)
+        self.batch_sizes = deque(maxlen=1000)
+        self.n_requests = 0
+        self.n_fallback = 0
+
+    async def submit(self, sentence):
+        if self.fallback is not None and self.queue.qsize() >= self.max_queue:
+            self.n_fallback += 1
+            return retrieve_sentences(self.fallback, [sentence])[0]
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((sentence, future, time.time()))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            sentences = [sentence for sentence, _, _ in batch]
+            try:
+                motions = await loop.run_in_executor(self.executor, self._infer, sentences)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            now = time.time()
+            for (_, future, start), motion in zip(batch, motions):
+                self.latency.append(now - start)
+                # the client may have gone away already
+                if not future.done():
+                    future.set_result(motion)
+            self.batch_sizes.append(len(batch))
+            self.n_requests += len(batch)
+
+    def _infer(self, sentences):
+        return infer_sentences(self.model, sentences, self.opt, self.data,
+                               batch_size=self.batch_size, n_workers=self.n_workers, decode=False)
+
+    def metrics(self):
+        latency = np.array(self.latency) * 1000 if self.latency else np.zeros(1)
+        return {
+            'requests': self.n_requests,
+            'queue_depth': self.queue.qsize(),
+            'fallback_requests': self.n_fallback,
+            'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            'latency_ms': {
+                'p50': float(np.percentile(latency, 50)),
+                'p95': float(np.percentile(latency, 95)),
+                'p99': float(np.percentile(latency, 99)),
+            }
+        }
+
+
+class GestureServer():
+    '''
+    minimal http server
+
+        POST /generate  {"sentence": str} or {"sentences": [str]}, optional "decode": bool
+                        -> {"poses": [[[float]]]}, smoothed skeleton poses (decode) or raw pca motion
+        GET  /metrics   -> latency, queue depth and batch size statistics
+    '''
+
+    def __init__(self, batcher, pca, smoother=None):
+        self.batcher = batcher
+        self.pose_decoder = PoseDecoder.from_pca(pca)
+        # filters the decoded joints like inference.py
+        self.smoother = smoother
+        # decoding runs off the event loop, one request at a time as the smoother has state
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def decode(self, motion):
+        if len(motion) == 0:
+            return motion
+        return smooth_clip(self.smoother, self.pose_decoder.decode(motion))
+
+    def _poses(self, motions, decode):
+        if decode:
+            motions = [self.decode(m) for m in motions]
+        return [np.asarray(m).tolist() for m in motions]
+
+    async def generate(self, request):
+        if not isinstance(request, dict):
+            raise ValueError('request body must be a json object')
+        sentences = request.get('sentences', [request.get('sentence', '')])
+        if not isinstance(sentences, list) or not all(isinstance(s, str) for s in sentences):
+            raise ValueError('"sentences" must be a list of strings')
+        motions = await asyncio.gather(*[self.batcher.submit(s) for s in sentences])
+        # a large request must not hold up the other connections and the batcher
+        poses = await asyncio.get_running_loop().run_in_executor(
+                                    self.executor, self._poses, motions, request.get('decode', True))
+        return {'poses': poses}
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode().split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                key, _, value = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            method, path = request_line[0], request_line[1]
+            if method == 'GET' and path == '/metrics':
+                status, response = '200 OK', self.batcher.metrics()
+            elif method == 'POST' and path == '/generate':
+                status, response = '200 OK', await self.generate(json.loads(body or b'{}'))
+            else:
+                status, response = '404 Not Found', {'error': 'unknown endpoint'}
+        except (ValueError, IndexError, KeyError, asyncio.IncompleteReadError) as e:
+            status, response = '400 Bad Request', {'error': str(e)}
+        except Exception as e:
+            # e.g. a model error passed on by the batcher, the client still gets an answer
+            status, response = '500 Internal Server Error', {'error': '{}: {}'.format(type(e).__name__, e)}
+
+        try:
+            payload = json.dumps(response).encode()
+            writer.write('HTTP/1.1 {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                         'Connection: close\r\n\r\n'.format(status, len(payload)).encode() + payload)
+            await writer.drain()
+        except ConnectionError:
+            # the client has gone away
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(model, opt, data, arg):
+    batcher = MicroBatcher(model, opt, data,
+                           max_batch=arg.max_batch,
+                           max_wait=arg.max_wait / 1000,
+                           batch_size=arg.batch_size,
+                           n_workers=arg.n_workers,
+                           fallback=MotionIndex.load(arg.retrieval, data) if arg.retrieval else None,
+                           max_queue=arg.max_queue)
+    server = GestureServer(batcher, data['pca'], filter_from_args(arg))
+    # keep a reference so the batching loop is not garbage collected
+    batch_task = asyncio.ensure_future(batcher.run())
+
+    if arg.unix_socket:
+        srv = await asyncio.start_unix_server(server.handle, path=arg.unix_socket)
+        print('[INFO] listening on unix socket: {}'.format(arg.unix_socket))
+    else:
+        srv = await asyncio.start_server(server.handle, host=arg.host, port=arg.port)
+        print('[INFO] listening on http://{}:{}'.format(arg.host, arg.port))
+
+    async with srv:
+        await srv.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-data', default='./processed_data/preprocessing.pickle')
+    parser.add_argument('-checkpoint', default='./trained_model/transformer.chkpt')
+    parser.add_argument('-host', default='127.0.0.1')
+    parser.add_argument('-port', type=int, default=8765)
+    parser.add_argument('-unix_socket', default=None)
+    parser.add_argument('-max_batch', type=int, default=32) # sentences per micro-batch
+    parser.add_argument('-max_wait', type=float, default=10) # ms
+    parser.add_argument('-batch_size', type=int, default=64) # word windows per forward
+    parser.add_argument('-n_workers', type=int, default=1)
+    parser.add_argument('-n_threads', type=int, default=0)
+    parser.add_argument('-retrieval', default=None) # retrieval index (retrieval.py) answering when overloaded
+    parser.add_argument('-max_queue', type=int, default=256) # queued sentences before the fallback answers
+    add_filter_args(parser)
+
+    arg = parser.parse_args()
+
+    if arg.n_threads > 0:
+        torch.set_num_threads(arg.n_threads)
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    data = torch.load(arg.data)
+    model_info = torch.load(arg.checkpoint)
+    opt = model_info['settings']
+    model = load_model(model_info, data, device)
+
+    asyncio.run(serve(model, opt, data, arg))
+
+
+if __name__ == '__main__':
+    main()
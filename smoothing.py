@@ -0,0 +1,172 @@
+import math
+import numpy as np
+
+
+class MotionFilter():
+    '''
+    base class of the causal motion filters
+
+    note:
+        filters keep their state across calls, so feeding a sequence in chunks
+        gives the same output as feeding it at once. inputs are numpy arrays or
+        torch tensors in shape [T x D] or [B x T x D], outputs have the same
+        type and shape.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.state = None
+
+    def __call__(self, frames):
+        is_torch = not isinstance(frames, np.ndarray) and hasattr(frames, 'detach')
+        x = frames.detach().cpu().numpy() if is_torch else np.asarray(frames)
+        dtype = x.dtype if np.issubdtype(x.dtype, np.floating) else np.float64
+
+        batched = x.ndim == 3
+        x = x.astype(np.float64)
+        if not batched:
+            x = x[np.newaxis]
+
+        y = self._filter(x) if x.shape[1] > 0 else x
+        if not batched:
+            y = y[0]
+        y = y.astype(dtype)
+
+        if is_torch:
+            import torch
+            return torch.from_numpy(y).to(frames.device)
+        return y
+
+    def _filter(self, x):
+        ''' x: B x T x D float64 '''
+        raise NotImplementedError
+
+
+class MovingAverageFilter(MotionFilter):
+    '''
+    mean of the last n frames
+
+    note:
+        the first frames average over the frames seen so far instead of
+        producing NaN like pandas rolling
+    '''
+
+    def __init__(self, n):
+        self.n = n
+        super().__init__()
+
+    def reset(self):
+        self.history = None
+
+    def _filter(self, x):
+        if self.history is None:
+            self.history = np.zeros((x.shape[0], 0, x.shape[2]))
+        full = np.concatenate((self.history, x), axis=1)
+        n_hist = self.history.shape[1]
+
+        csum = np.concatenate((np.zeros((x.shape[0], 1, x.shape[2])), np.cumsum(full, axis=1)), axis=1)
+        end = np.arange(n_hist + 1, full.shape[1] + 1)
+        start = np.maximum(end - self.n, 0)
+        y = (csum[:, end] - csum[:, start]) / (end - start)[np.newaxis, :, np.newaxis]
+
+        self.history = full[:, max(full.shape[1] - (self.n - 1), 0):]
+        return y
+
+
+class ExponentialFilter(MotionFilter):
+    ''' y_t = alpha * x_t + (1 - alpha) * y_t-1 '''
+
+    def __init__(self, alpha=0.5):
+        self.alpha = alpha
+        super().__init__()
+
+    def _filter(self, x):
+        y = np.empty_like(x)
+        prev = x[:, 0] if self.state is None else self.state
+        for t in range(x.shape[1]):
+            prev = self.alpha * x[:, t] + (1 - self.alpha) * prev
+            y[:, t] = prev
+        self.state = prev
+        return y
+
+
+class OneEuroFilter(MotionFilter):
+    '''
+    speed adaptive low-pass filter (Casiez et al., 2012)
+
+    note:
+        slow motion is smoothed strongly to remove jitter, fast motion
+        raises the cutoff frequency to keep the lag small
+    '''
+
+    def __init__(self, freq=12, min_cutoff=1.0, beta=0.0, d_cutoff=1.0):
+        self.freq = freq
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        super().__init__()
+
+    def _alpha(self, cutoff):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau * self.freq)
+
+    def _filter(self, x):
+        y = np.empty_like(x)
+        if self.state is None:
+            self.state = (x[:, 0], np.zeros_like(x[:, 0]))
+        prev_x, prev_dx = self.state
+
+        a_d = self._alpha(self.d_cutoff)
+        for t in range(x.shape[1]):
+            dx = (x[:, t] - prev_x) * self.freq
+            dx_hat = a_d * dx + (1 - a_d) * prev_dx
+            cutoff = self.min_cutoff + self.beta * np.abs(dx_hat)
+            a = self._alpha(cutoff)
+            prev_x = a * x[:, t] + (1 - a) * prev_x
+            prev_dx = dx_hat
+            y[:, t] = prev_x
+
+        self.state = (prev_x, prev_dx)
+        return y
+
+
+def build_filter(name, n=3, alpha=0.5, freq=12, min_cutoff=1.0, beta=0.0):
+    '''
+    note:
+        every path (inference, streaming, batch, server) filters the decoded
+        joint positions, speed adaptive filters give other results on pca coefficients
+    return:
+        filter instance, None for 'none'
+    '''
+    if name == 'none':
+        return None
+    elif name == 'moving_average':
+        return MovingAverageFilter(n)
+    elif name == 'exponential':
+        return ExponentialFilter(alpha)
+    elif name == 'one_euro':
+        return OneEuroFilter(freq=freq, min_cutoff=min_cutoff, beta=beta)
+    raise ValueError('unknown filter: {}'.format(name))
+
+
+def smooth_clip(smoother, poses):
+    ''' filter a whole clip from a fresh state, poses are returned as they are without a filter '''
+    if smoother is None:
+        return poses
+    smoother.reset()
+    return smoother(poses)
+
+
+def add_filter_args(parser):
+    parser.add_argument('-filter', default='moving_average') # none, moving_average, exponential or one_euro
+    parser.add_argument('-n_filter', type=int, default=3) # moving average frames
+    parser.add_argument('-filter_alpha', type=float, default=0.5) # exponential
+    parser.add_argument('-filter_min_cutoff', type=float, default=1.0) # one euro, hz
+    parser.add_argument('-filter_beta', type=float, default=0.0) # one euro
+
+
+def filter_from_args(arg):
+    return build_filter(arg.filter, n=arg.n_filter, alpha=arg.filter_alpha,
+                        min_cutoff=arg.filter_min_cutoff, beta=arg.filter_beta)
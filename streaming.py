@@ -0,0 +1,119 @@
+import numpy as np
+import torch
+
+import constant as Constant
+
+from inference import inference
+from pose_decoder import PoseDecoder
+
+
+class StreamingSession():
+    '''
+    word by word inference for a live speech stream
+
+    note:
+        words are split into the same windows as infer_from_words,
+        a window is inferred as soon as its last word arrives and the
+        motion of the previous window seeds the next one.
+        with decode the emitted frames are skeleton poses. an optional
+        smoother (see smoothing.py) filters these joints like inference.py
+        does, its state carries over from one push to the next.
+    '''
+
+    def __init__(self, model, opt, data, words_per_sec=2.5, smoother=None, decode=False):
+        if smoother is not None and not decode:
+            raise ValueError('smoothing is applied to the decoded joints, use decode=True')
+        self.model = model
+        self.opt = opt
+        self.data = data
+        self.words_per_sec = words_per_sec
+        self.smoother = smoother
+        self.pose_decoder = PoseDecoder.from_pca(data['pca']) if decode else None
+        # dataset has 12 fps
+        self.frame_duration = 1/12
+        # transformer encoder positions are limited to n_position (with SOS and EOS)
+        self.max_window = None
+        if opt.model == 'transformer':
+            self.max_window = getattr(opt, 'n_position', 10) - 2
+        self.reset()
+
+    def reset(self):
+        self.n_pre, self.n_est = self._window_size(self.words_per_sec)
+        self.words = [Constant.UNK_WORD] * self.n_pre
+        self.timestamps = []
+        self.start = 0
+        self.pre_motion_seq = np.zeros((30, self.data['pca'].n_components))
+        if self.smoother is not None:
+            self.smoother.reset()
+
+    def _window_size(self, words_per_sec):
+        n_pre = round(words_per_sec * self.opt.pre_motions * self.frame_duration)
+        n_est = round(words_per_sec * self.opt.estimation_motions * self.frame_duration)
+        if self.max_window is not None:
+            n_est = min(n_est, self.max_window - n_pre)
+        return n_pre, max(n_est, 1)
+
+    def _update_speed(self, timestamp):
+        self.timestamps.append(timestamp)
+        if len(self.timestamps) > 1 and self.timestamps[-1] > self.timestamps[0]:
+            wps = (len(self.timestamps) - 1) / (self.timestamps[-1] - self.timestamps[0])
+            # the new speed applies from the next window on, the pre motion
+            # words stay as they were at the start of the utterance
+            self.n_est = self._window_size(wps)[1]
+
+    def _infer_window(self, sample_words):
+        with torch.no_grad():
+            output, _ = inference(
+                            model=self.model,
+                            input_words=sample_words,
+                            pre_motion_seq=self.pre_motion_seq,
+                            opt=self.opt,
+                            data=self.data)
+        self.pre_motion_seq = np.asarray(output)
+        return self.pre_motion_seq
+
+    def _emit(self, final=False):
+        outputs = []
+        while True:
+            end = self.start + self.n_pre + self.n_est
+            if end > len(self.words) and not (final and self.start < len(self.words) - self.n_pre):
+                break
+            outputs.append(self._infer_window(self.words[self.start:end]))
+            self.start += self.n_est
+
+        if len(outputs) == 0:
+            return np.zeros((0, 24 if self.pose_decoder else self.data['pca'].n_components))
+        outputs = np.concatenate(outputs)
+        if self.pose_decoder is not None:
+            outputs = self.pose_decoder.decode(outputs)
+        if self.smoother is not None:
+            outputs = self.smoother(outputs)
+        return outputs
+
+    def push(self, word, timestamp=None):
+        '''
+        add a recognized word
+
+        param:
+            word - normalized word
+            timestamp - optional speech time of the word in seconds
+        return:
+            motion frames [frames x pca dim] (or poses [frames x 24] with decode)
+            of the windows completed by this word
+        '''
+        self.words.append(word)
+        if timestamp is not None:
+            self._update_speed(timestamp)
+        return self._emit()
+
+    def push_words(self, words, timestamps=None):
+        if timestamps is None:
+            timestamps = [None] * len(words)
+        outputs = [self.push(w, t) for w, t in zip(words, timestamps)]
+        return np.concatenate(outputs) if outputs else self._emit()
+
+    def flush(self):
+        ''' end of utterance, infer the remaining partial windows '''
+        outputs = self._emit(final=True)
+        self.reset()
+        return outputs
@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import pytest
+
+# the modules live at the repository root and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SENTENCE = 'and men in general are physically stronger of course there are many exceptions laughter'
+
+
+@pytest.fixture
+def words():
+    return SENTENCE.split(' ')
+
+
+@pytest.fixture
+def data():
+    '''
+    preprocessed data of a tiny dataset: vocabulary of the test sentence,
+    random 12 dim embedding, 10 component pca of random poses and a few clips
+    '''
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('sklearn')
+    from sklearn.decomposition import PCA
+    import constant as Constant
+
+    rng = np.random.RandomState(0)
+    vocab = [Constant.PAD_WORD, Constant.UNK_WORD, Constant.BOS_WORD, Constant.EOS_WORD]
+    vocab += sorted(set(SENTENCE.split(' ')))
+    word2idx = {word: i for i, word in enumerate(vocab)}
+
+    pca = PCA(n_components=10).fit(rng.randn(200, 24))
+
+    def clips(n):
+        # sentences of 5 to 12 words, 12 fps at 2.5 words per second
+        src, tgt = [], []
+        for _ in range(n):
+            n_words = rng.randint(5, 13)
+            src.append(list(rng.randint(4, len(vocab), n_words)))
+            tgt.append(rng.randn(int(n_words / 2.5 * 12), 10))
+        return {'src': src, 'tgt': tgt}
+
+    return {
+        'dict': word2idx,
+        'emb_tbl': rng.randn(len(vocab), 12),
+        'pca': pca,
+        'train': clips(6),
+        'valid': clips(4),
+    }
+
+
+@pytest.fixture
+def tiny_transformer(data):
+    ''' return: transformer in eval mode, its settings '''
+    torch = pytest.importorskip('torch')
+    from transformer.models import Transformer
+    import constant as Constant
+
+    torch.manual_seed(0)
+    opt = argparse.Namespace(model='transformer', pre_motions=10, estimation_motions=20,
+                             src_pad_idx=Constant.PAD, n_position=10)
+    model = Transformer(emb_matrix=data['emb_tbl'], n_src_vocab=len(data['dict']),
+                        src_pad_idx=Constant.PAD, trg_pad_idx=None,
+                        d_word_vec=12, d_enc_model=12, d_dec_model=10, d_inner=256,
+                        n_layers=1, n_head=2, d_k=4, d_v=4)
+    model.eval()
+    return model, opt
+
+
+@pytest.fixture
+def tiny_seq2pos(data):
+    ''' return: seq2pos model in eval mode, its settings '''
+    torch = pytest.importorskip('torch')
+    from seq2pose.models import Seq2Pose
+    import constant as Constant
+
+    torch.manual_seed(0)
+    opt = argparse.Namespace(model='seq2pos', pre_motions=10, estimation_motions=20,
+                             src_pad_idx=Constant.PAD, tf_ratio=1.0)
+    model = Seq2Pose(word_emb=data['emb_tbl'], batch_size=1, hidden_size=64, bidirectional=True,
+                     n_enc_layers=1, n_dec_layers=1, dropout=0, out_dim=10)
+    model.eval()
+    return model, opt
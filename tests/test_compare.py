@@ -0,0 +1,49 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+pytest.importorskip('matplotlib')
+
+from compare import clip_words, predict_poses, stack_panels
+from pose_decoder import PoseDecoder
+from render import SkeletonRenderer
+from smoothing import build_filter, smooth_clip
+
+import constant as Constant
+
+
+def test_stack_panels_pads_with_nan():
+    grid = stack_panels([np.ones((5, 24)), np.zeros((3, 24))])
+    assert grid.shape == (5, 2, 24)
+    np.testing.assert_array_equal(grid[:, 0], np.ones((5, 24)))
+    np.testing.assert_array_equal(grid[:3, 1], np.zeros((3, 24)))
+    assert np.isnan(grid[3:, 1]).all()
+
+
+def test_compare_clip_frames(tiny_transformer, tiny_seq2pos, data):
+    idx2word = {idx: word for word, idx in data['dict'].items()}
+    assert clip_words([4, 1, 999], idx2word) == [idx2word[4], Constant.UNK_WORD, Constant.UNK_WORD]
+
+    pose_decoder = PoseDecoder.from_pca(data['pca'])
+    smoother = build_filter('moving_average', n=3)
+    src, tgt = data['valid']['src'][0], data['valid']['tgt'][0]
+    words = clip_words(src, idx2word)
+    ground_truth = pose_decoder.decode(tgt)
+
+    panels = [smooth_clip(smoother, ground_truth)]
+    for model, opt in (tiny_seq2pos, tiny_transformer):
+        poses = predict_poses(model, opt, words, len(ground_truth), data, pose_decoder, smoother)
+        # windows are timed to the ground truth, the prediction is never longer
+        assert poses.shape[1] == 24
+        assert 0 < len(poses) <= len(ground_truth)
+        panels.append(poses)
+
+    grid = stack_panels(panels)
+    assert grid.shape == (len(ground_truth), 3, 24)
+
+    renderer = SkeletonRenderer(titles=['ground truth', 'seq2pos', 'transformer'],
+                                caption=' '.join(words), figsize=(6, 3), dpi=40)
+    frames = list(renderer.frames(grid[:2]))
+    assert len(frames) == 2
+    assert frames[0].shape == (renderer.height, renderer.width, 3)
+    assert frames[0].dtype == np.uint8
@@ -0,0 +1,24 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from train import model_predict
+
+
+def test_seq2pos_teacher_frames_line_up(tiny_seq2pos, data):
+    # tf_ratio 1, the decoder sees the ground truth like generate() sees the pre motion
+    model, opt = tiny_seq2pos
+
+    src_seq = torch.randint(4, len(data['dict']), (3, 7))
+    src_len = [7, 7, 7]
+    tgt_seq = torch.randn(3, 30, 10)
+
+    with torch.no_grad():
+        pred, ans = model(opt, src_seq, src_len, tgt_seq, torch.device('cpu'))
+        teacher_pred = model_predict(model, opt, src_seq, src_len, tgt_seq)
+
+    assert teacher_pred.shape == pred.shape == ans.shape
+    # both were fed the same frames 0..9, so the first predicted frame is the same
+    torch.testing.assert_close(teacher_pred[:, 0], pred[:, 0])
+    # inference goes on from its own output, the ground truth fed to forward differs
+    assert not torch.allclose(teacher_pred[:, 1], pred[:, 1])
@@ -0,0 +1,34 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+
+from embedding import prune_vocab
+
+import constant as Constant
+
+
+def test_prune_vocab_drops_rows_without_vector():
+    words = ['look', 'at', 'zzyzx', 'the', 'world', 'qwfp']
+    word2idx = {Constant.PAD_WORD: Constant.PAD, Constant.UNK_WORD: Constant.UNK,
+                Constant.BOS_WORD: Constant.BOS, Constant.EOS_WORD: Constant.EOS}
+    for w in words:
+        word2idx[w] = len(word2idx)
+    emb_tb = np.arange(len(word2idx) * 3, dtype=np.float64).reshape(-1, 3)
+    train = [[word2idx[w] for w in ['look', 'at', 'zzyzx', 'world']]]
+    valid = [[word2idx[w] for w in ['the', 'qwfp', 'world']]]
+
+    new_word2idx, new_emb_tb, (new_train, new_valid) = prune_vocab(
+                                        word2idx, emb_tb, [train, valid], ['zzyzx', 'qwfp'])
+
+    assert len(new_emb_tb) == len(emb_tb) - 2
+    assert set(new_word2idx) == set(word2idx) - {'zzyzx', 'qwfp'}
+    for special in (Constant.PAD, Constant.UNK, Constant.BOS, Constant.EOS):
+        assert new_word2idx[{v: k for k, v in word2idx.items()}[special]] == special
+    # every kept word keeps its vector
+    for w, i in new_word2idx.items():
+        np.testing.assert_array_equal(new_emb_tb[i], emb_tb[word2idx[w]])
+
+    new_idx2word = {i: w for w, i in new_word2idx.items()}
+    assert [new_idx2word[i] for i in new_train[0]] == ['look', 'at', Constant.UNK_WORD, 'world']
+    assert [new_idx2word[i] for i in new_valid[0]] == ['the', Constant.UNK_WORD, 'world']
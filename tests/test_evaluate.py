@@ -0,0 +1,58 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+
+from evaluate import diversity, frechet_distance, joint_norm, motion_metrics, pad_clips
+from pose_decoder import PoseDecoder
+
+
+def test_pad_clips_and_joint_norm():
+    out = pad_clips([np.ones((2, 3)), np.zeros((4, 3))])
+    assert out.shape == (2, 4, 3)
+    assert np.isnan(out[0, 2:]).all()
+    np.testing.assert_array_equal(out[1], np.zeros((4, 3)))
+
+    x = np.tile([3.0, 4.0, 0.0], 8)
+    np.testing.assert_allclose(joint_norm(x), np.full(8, 5.0))
+
+
+def test_frechet_distance():
+    x = np.random.RandomState(0).randn(500, 2)
+    assert frechet_distance(x, x) == pytest.approx(0, abs=1e-8)
+    # same covariance, means 1 and 2 apart: 1 + 4
+    assert frechet_distance(x, x + [1, 2]) == pytest.approx(5)
+    # 1d, same mean, standard deviation 1 and 2: var 1 + var 4 - 2 * sqrt(1 * 4) = 1
+    z = (x[:, :1] - x[:, :1].mean()) / x[:, :1].std(ddof=1)
+    assert frechet_distance(z, 2 * z) == pytest.approx(1)
+
+
+def test_diversity():
+    # clip features (mean, std): (0, 0), (3, 0) and (0, 4), pairwise distances 3, 4 and 5
+    motion = pad_clips([np.zeros((4, 1)), np.full((2, 1), 3.0), np.array([[-4.0], [4.0]])])
+    assert diversity(motion) == pytest.approx((3 + 4 + 5) * 2 / 6)
+    assert diversity(motion[:1]) == 0.0
+
+
+def test_motion_metrics():
+    # identity decoder, the pca motion is the pose
+    pose_decoder = PoseDecoder(np.eye(24), np.zeros(24))
+    t = np.arange(10, dtype=np.float64)[:, np.newaxis]
+    gt = [t * np.ones(24), t[:6] ** 2 * np.ones(24)]
+    # a constant offset of 1 on every coordinate, the second prediction is longer
+    pred = [gt[0] + 1, np.concatenate((gt[1] + 1, np.zeros((3, 24))))]
+
+    metrics = motion_metrics(pred, gt, pose_decoder)
+
+    assert metrics['clips'] == 2
+    assert metrics['frames'] == 16
+    assert metrics['joint_mse'] == pytest.approx(1)
+    assert metrics['velocity_error'] == pytest.approx(0)
+    assert metrics['acceleration_error'] == pytest.approx(0)
+    # linear motion has no jerk, t^2 neither
+    assert metrics['jerk'] == pytest.approx(0)
+    assert metrics['jerk_gt'] == pytest.approx(0)
+    assert metrics['variance'] == pytest.approx(metrics['variance_gt'])
+    assert metrics['diversity'] == pytest.approx(metrics['diversity_gt'])
+    # every coordinate is shifted by 1
+    assert metrics['fd_pca'] == pytest.approx(24, rel=1e-4)
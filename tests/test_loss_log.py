@@ -0,0 +1,45 @@
+import argparse
+import math
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('pandas')
+pytest.importorskip('seaborn')
+
+import train
+import plot
+
+
+def test_valid_interval_logs_load(tmp_path, monkeypatch):
+    train_losses = [1.0, 0.9, 0.8, 0.7, 0.6]
+    epoch_losses = iter(train_losses)
+    monkeypatch.setattr(train, 'train_epoch', lambda *args, **kwargs: next(epoch_losses))
+    monkeypatch.setattr(train, 'eval_epoch', lambda *args, **kwargs: 0.5)
+
+    opt = argparse.Namespace(log=str(tmp_path) + '/', model='transformer', epoch=5,
+                             valid_mode='sync', valid_interval=2, save_model=None, save_mode='best')
+    model = torch.nn.Linear(2, 2)
+    train.train(model, None, None, None, torch.device('cpu'), opt)
+
+    loss_df = plot.load_loss(opt.log + 'transformer_train.log', opt.log + 'transformer_valid.log')
+
+    assert list(loss_df['Epoch']) == [0, 1, 2, 3, 4]
+    assert list(loss_df['Train_loss']) == pytest.approx(train_losses)
+    # epochs 1 and 3 by the interval, the last epoch is always validated
+    validated = [not math.isnan(v) for v in loss_df['Valid_loss']]
+    assert validated == [False, True, False, True, True]
+
+
+def test_valid_log_out_of_order(tmp_path):
+    log_train_file = tmp_path / 'train.log'
+    log_valid_file = tmp_path / 'valid.log'
+    log_train_file.write_text('epoch,loss\n0, 1.00000\n1, 0.90000\n2, 0.80000\n')
+    # async results arrive when they finish, epoch 1 was skipped by a busy validator
+    log_valid_file.write_text('epoch,loss\n2, 0.70000\n0, 0.95000\n')
+
+    loss_df = plot.load_loss(str(log_train_file), str(log_valid_file))
+
+    assert list(loss_df['Epoch']) == [0, 1, 2]
+    assert loss_df['Valid_loss'][0] == pytest.approx(0.95)
+    assert math.isnan(loss_df['Valid_loss'][1])
+    assert loss_df['Valid_loss'][2] == pytest.approx(0.7)
@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+
+from inference import infer_from_words, split_windows
+from motion_cache import MotionCache, model_hash
+
+
+@pytest.mark.parametrize('name', ['tiny_transformer', 'tiny_seq2pos'])
+def test_cached_run_matches_uncached(request, name, data, words, tmp_path):
+    model, opt = request.getfixturevalue(name)
+    n_windows = len(split_windows(words, opt)[0])
+    expected = [out.out_motion for out in infer_from_words(model, words, opt, data)]
+
+    cache = MotionCache(model_hash(model), cache_dir=str(tmp_path))
+    for n_run in (1, 2):
+        outputs = [out.out_motion for out in infer_from_words(model, words, opt, data, cache=cache)]
+        assert len(outputs) == n_windows
+        for e, o in zip(expected, outputs):
+            np.testing.assert_allclose(o, e, atol=1e-6)
+    # the first run fills the cache, the second one only hits
+    assert cache.stats()['misses'] == n_windows
+    assert cache.stats()['hits'] == n_windows
+
+    # a later run with the same model reads the windows from disk
+    cache = MotionCache(model_hash(model), cache_dir=str(tmp_path))
+    outputs = [out.out_motion for out in infer_from_words(model, words, opt, data, cache=cache)]
+    assert cache.stats()['hits'] == n_windows
+    for e, o in zip(expected, outputs):
+        np.testing.assert_allclose(o, e, atol=1e-6)
+
+
+def test_eviction_at_capacity(tmp_path):
+    cache = MotionCache('model', max_size=2, cache_dir=str(tmp_path))
+    keys = [cache.key([w]) for w in ('a', 'b', 'c')]
+    cache.put(keys[0], np.zeros((2, 10)))
+    cache.put(keys[1], np.ones((2, 10)))
+    # a is used again, b is the least recently used one
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], np.full((2, 10), 2.0))
+
+    assert cache.get(keys[1]) is None
+    np.testing.assert_array_equal(cache.get(keys[0]), np.zeros((2, 10)))
+    np.testing.assert_array_equal(cache.get(keys[2]), np.full((2, 10), 2.0))
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'hit_rate': 0.75, 'size': 2}
+    # the evicted window is gone from disk too
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+
+    # other models and seeds give other keys
+    assert cache.key(['a']) != MotionCache('other').key(['a'])
+    assert cache.key(['a']) != cache.key(['a'], np.zeros((10, 10)))
@@ -0,0 +1,75 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from motion_io import MotionReader, MotionWriter, load_motion, save_motion
+
+# quantization error of each encoding on the test motion
+TOLERANCE = {'float16': 1e-2, 'delta16': 1e-3, 'delta8': 5e-2}
+
+
+def random_motion(n_frames=100, n_dims=24):
+    # smooth random walk, like joint trajectories
+    return np.cumsum(np.random.RandomState(0).randn(n_frames, n_dims) * 0.05, axis=0).astype(np.float32)
+
+
+@pytest.mark.parametrize('encoding', ['float16', 'delta16', 'delta8'])
+def test_round_trip(tmp_path, encoding):
+    frames = random_motion()
+    path = str(tmp_path / 'motion.bin')
+    save_motion(path, frames, fps=12, layout='joints', encoding=encoding, chunk_frames=16)
+
+    loaded, reader = load_motion(path)
+    assert reader.complete
+    assert (reader.n_frames, reader.n_dims, reader.fps, reader.layout) == (100, 24, 12, 'joints')
+    np.testing.assert_allclose(loaded, frames, atol=TOLERANCE[encoding])
+
+    # partial reads inside one chunk, across chunks and up to the last partial chunk
+    for start, stop in [(3, 10), (10, 50), (90, 100), (95, 200), (50, 50)]:
+        np.testing.assert_array_equal(reader.read(start, stop), loaded[start:stop])
+
+
+@pytest.mark.parametrize('encoding', ['float16', 'delta16', 'delta8'])
+def test_read_incomplete_file(tmp_path, encoding):
+    frames = random_motion()
+    path = str(tmp_path / 'motion.bin')
+    writer = MotionWriter(path, 24, encoding=encoding, chunk_frames=16)
+    writer.write(frames[:40])
+
+    # the writer is still open, only its complete chunks can be read
+    reader = MotionReader(path)
+    assert not reader.complete
+    assert reader.n_frames == 32
+    np.testing.assert_allclose(reader.read(), frames[:32], atol=TOLERANCE[encoding])
+
+    writer.write(frames[40:])
+    writer.close()
+    reader = MotionReader(path)
+    assert reader.complete
+    assert reader.n_frames == 100
+
+
+def test_fixed_step_clips(tmp_path, capsys):
+    frames = random_motion()
+    # a jump far larger than 127 steps
+    frames[50:] += 10
+    path = str(tmp_path / 'motion.bin')
+    save_motion(path, frames, encoding='delta8', chunk_frames=64, step=0.01)
+
+    assert 'deltas were clipped by the fixed step' in capsys.readouterr().out
+    loaded, reader = load_motion(path)
+    assert reader.step == pytest.approx(0.01)
+    # the motion lags behind the jump, then catches up (closed loop encoding)
+    assert np.abs(loaded[50] - frames[50]).max() > 1
+    np.testing.assert_allclose(loaded[-1], frames[-1], atol=0.01)
+
+
+def test_derived_step_does_not_clip(tmp_path, capsys):
+    frames = random_motion()
+    frames[50:] += 10
+    path = str(tmp_path / 'motion.bin')
+    save_motion(path, frames, encoding='delta8', chunk_frames=64)
+
+    assert 'clipped' not in capsys.readouterr().out
+    loaded, _ = load_motion(path)
+    np.testing.assert_allclose(loaded, frames, atol=0.1)
@@ -0,0 +1,45 @@
+import argparse
+import pytest
+
+torch = pytest.importorskip('torch')
+np = pytest.importorskip('numpy')
+pytest.importorskip('onnx')
+pytest.importorskip('onnxruntime')
+
+from export_onnx import export_seq2pos, export_transformer
+from inference import inference, inference_batch
+from onnx_backend import load_onnx_model
+
+
+def test_transformer_parity(tiny_transformer, data, words, tmp_path):
+    model, opt = tiny_transformer
+    opt = argparse.Namespace(d_dec_model=10, **vars(opt))
+    with torch.no_grad():
+        export_transformer(model, opt, str(tmp_path / 'transformer.onnx'), opset=13)
+    onnx_model = load_onnx_model(str(tmp_path), opt)
+
+    # traced with one sentence of 8 tokens, run with 3 padded sentences of other lengths
+    windows = [words[:3], words[3:9], words[9:13]]
+    expected = inference_batch(model, windows, opt, data)
+    outputs = inference_batch(onnx_model, windows, opt, data)
+
+    assert len(outputs) == len(windows)
+    for e, o in zip(expected, outputs):
+        assert o.shape == (opt.estimation_motions, 10)
+        np.testing.assert_allclose(o, e, atol=1e-4)
+
+
+def test_seq2pos_parity(tiny_seq2pos, data, words, tmp_path):
+    model, opt = tiny_seq2pos
+    opt = argparse.Namespace(n_dec_layers=1, **vars(opt))
+    with torch.no_grad():
+        export_seq2pos(model, opt, str(tmp_path / 'seq2pos_encoder.onnx'),
+                       str(tmp_path / 'seq2pos_decoder.onnx'), opset=13)
+    onnx_model = load_onnx_model(str(tmp_path), opt)
+
+    pre_motion_seq = np.random.RandomState(0).randn(30, 10)
+    for sample_words in (words[:3], words[:11]):
+        expected, _ = inference(model, sample_words, pre_motion_seq, opt, data)
+        output, _ = inference(onnx_model, sample_words, pre_motion_seq, opt, data)
+        assert output.shape == (opt.estimation_motions, 10)
+        np.testing.assert_allclose(output, expected, atol=1e-4)
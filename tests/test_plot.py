@@ -0,0 +1,31 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+matplotlib = pytest.importorskip('matplotlib')
+pytest.importorskip('seaborn')
+pytest.importorskip('sklearn')
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+from matplotlib.collections import LineCollection
+from plot import display_pose_grid
+from render import SKELETON
+
+
+def test_display_pose_grid_segments():
+    poses = np.random.RandomState(0).uniform(-1, 1, (5, 24))
+    fig, ax = plt.subplots()
+    lines = display_pose_grid(poses, col=2, ax=ax)
+
+    # one collection holds every bone of every pose
+    assert [c for c in ax.collections if isinstance(c, LineCollection)] == [lines]
+    segments = lines.get_segments()
+    assert len(segments) == 5 * len(SKELETON)
+    # pose 3 is in row 1, column 1
+    spacing = segments[len(SKELETON)][0][0] - poses[1, 0]
+    np.testing.assert_allclose(segments[3 * len(SKELETON)][0],
+                               poses[3, :2] + [spacing, -spacing])
+    assert len(lines.get_colors()) == 5 * len(SKELETON)
+    fig.canvas.draw()
+    plt.close(fig)
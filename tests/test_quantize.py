@@ -0,0 +1,24 @@
+import copy
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from torch import nn
+from quantize import compare_models, quantize_model, state_size
+
+
+@pytest.mark.parametrize('name', ['tiny_transformer', 'tiny_seq2pos'])
+def test_quantize_model(request, name, data, words):
+    model, opt = request.getfixturevalue(name)
+    int8_model = quantize_model(copy.deepcopy(model))
+
+    modules = list(int8_model.modules())
+    assert not any(type(m) in (nn.Linear, nn.GRU) for m in modules)
+    assert any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in modules)
+    if name == 'tiny_seq2pos':
+        assert any(isinstance(m, torch.ao.nn.quantized.dynamic.GRU) for m in modules)
+    assert state_size(int8_model) < state_size(model)
+
+    mse, max_err, _, _ = compare_models(model, int8_model, [words, words[:6]], opt, data)
+    assert mse < 1e-2
+    assert max_err < 0.5
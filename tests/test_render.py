@@ -0,0 +1,49 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('matplotlib')
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from render import SkeletonRenderer
+
+
+def random_pose():
+    return np.random.RandomState(0).uniform(-5, 5, 24)
+
+
+def test_render_frame_shape():
+    renderer = SkeletonRenderer(figsize=(4, 3), dpi=51)
+    frame = renderer.render_frame(random_pose())
+
+    assert frame.dtype == np.uint8
+    # 204 x 153 pixels, cropped to an even size for yuv420p
+    assert frame.shape == (152, 204, 3) == (renderer.height, renderer.width, 3)
+    assert (frame != renderer.background).any()
+
+
+def test_nan_pose_leaves_background():
+    renderer = SkeletonRenderer(figsize=(4, 3), dpi=50)
+    np.testing.assert_array_equal(renderer.render_frame(np.full(24, np.nan)), renderer.background)
+
+    # a missing panel stays empty, the other one is drawn
+    renderer = SkeletonRenderer(figsize=(6, 3), dpi=50, titles=['a', 'b'])
+    frame = renderer.render_frame(np.stack([random_pose(), np.full(24, np.nan)]))
+    half = renderer.width // 2
+    assert (frame[:, :half] != renderer.background[:, :half]).any()
+    np.testing.assert_array_equal(frame[:, half:], renderer.background[:, half:])
+
+
+def test_to_pixel_matches_matplotlib():
+    renderer = SkeletonRenderer(x_lim=(-7, 7), y_lim=(-5, 9), figsize=(4, 3), dpi=50)
+
+    fig = Figure(figsize=(4, 3), dpi=50)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1, xlim=(-7, 7), ylim=(-5, 9))
+    canvas.draw()
+
+    pose = random_pose()
+    expected = ax.transData.transform(pose.reshape(-1, 3)[:, :2])
+    # pixel rows count from the top
+    expected[:, 1] = fig.bbox.height - expected[:, 1]
+    np.testing.assert_allclose(renderer.to_pixel(pose), expected, atol=1e-6)
@@ -0,0 +1,50 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+
+from retrieval import MotionIndex, build_index, retrieve_sentences
+
+
+@pytest.fixture
+def index_data(data, words):
+    # three clips without shared words, 4 words spoken in 4 seconds each
+    rng = np.random.RandomState(1)
+    clip_words = [words[0:4], words[4:8], words[9:13]]
+    data = dict(data)
+    data['train'] = {'src': [[data['dict'][w] for w in ws] for ws in clip_words],
+                     'tgt': [rng.randn(48, 10) for _ in clip_words]}
+    return data, clip_words
+
+
+def test_top_hit_is_the_matching_clip(index_data):
+    data, clip_words = index_data
+    index = build_index(data)
+
+    # two windows per clip, [UNK, w0, w1] and [w1, w2, w3]
+    assert len(index) == 6
+    assert index.motions.shape == (6, 20, 10)
+    for clip, ws in enumerate(clip_words):
+        neighbours, scores = index.search([ws[1:4]], k=3)
+        best = neighbours[0, 0]
+        assert (index.clips[best], index.starts[best]) == (clip, 20)
+        assert scores[0, 0] == pytest.approx(1, abs=1e-5)
+        assert (np.diff(scores[0]) <= 0).all()
+        np.testing.assert_allclose(index.motions[best], data['train']['tgt'][clip][20:40], atol=1e-6)
+
+    # at 2.5 words per second the 4 words make a single window
+    motion, = retrieve_sentences(index, [' '.join(clip_words[2])])
+    assert motion.shape == (20, 10)
+
+
+def test_save_load_round_trip(index_data, tmp_path):
+    data, clip_words = index_data
+    index = build_index(data, pre_motions=10, estimation_motions=20)
+    path = str(tmp_path / 'index.npz')
+    index.save(path)
+
+    loaded = MotionIndex.load(path, data)
+    for name in ('keys', 'motions', 'clips', 'starts'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(index, name))
+    assert (loaded.opt.pre_motions, loaded.opt.estimation_motions) == (10, 20)
+    np.testing.assert_array_equal(loaded.generate(clip_words[1]), index.generate(clip_words[1]))
@@ -0,0 +1,55 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from smoothing import build_filter, smooth_clip
+
+FILTERS = [('moving_average', {'n': 4}), ('exponential', {'alpha': 0.3}),
+           ('one_euro', {'min_cutoff': 0.5, 'beta': 0.2})]
+
+
+def motion(shape=(2, 50, 24)):
+    return np.cumsum(np.random.RandomState(0).randn(*shape), axis=-2)
+
+
+@pytest.mark.parametrize('name, kwargs', FILTERS)
+def test_chunks_match_one_pass(name, kwargs):
+    x = motion()[0]
+    expected = build_filter(name, **kwargs)(x)
+
+    smoother = build_filter(name, **kwargs)
+    # chunk sizes below, equal to and above the moving average window, and an empty chunk
+    bounds = [0, 1, 3, 3, 7, 11, 30, 50]
+    chunked = np.concatenate([smoother(x[a:b]) for a, b in zip(bounds[:-1], bounds[1:])])
+    np.testing.assert_allclose(chunked, expected, rtol=1e-12, atol=1e-12)
+
+    # a reset starts over
+    smoother.reset()
+    np.testing.assert_allclose(smoother(x), expected)
+    np.testing.assert_allclose(smooth_clip(smoother, x), expected)
+
+
+@pytest.mark.parametrize('name, kwargs', FILTERS)
+def test_batched_numpy_and_torch_match(name, kwargs):
+    torch = pytest.importorskip('torch')
+    x = motion()
+
+    single = np.stack([build_filter(name, **kwargs)(clip) for clip in x])
+    batched = build_filter(name, **kwargs)(x)
+    np.testing.assert_allclose(batched, single)
+
+    out = build_filter(name, **kwargs)(torch.from_numpy(x))
+    assert isinstance(out, torch.Tensor)
+    assert out.dtype == torch.float64
+    np.testing.assert_allclose(out.numpy(), single)
+
+    out = build_filter(name, **kwargs)(torch.from_numpy(x).float())
+    assert out.dtype == torch.float32
+    np.testing.assert_allclose(out.numpy(), single, rtol=1e-4, atol=1e-4)
+
+
+def test_moving_average_values():
+    x = np.arange(6, dtype=np.float64)[:, np.newaxis]
+    y = build_filter('moving_average', n=3)(x)
+    np.testing.assert_allclose(y[:, 0], [0, 0.5, 1, 2, 3, 4])
+    assert build_filter('none') is None
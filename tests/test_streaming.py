@@ -0,0 +1,22 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+
+from batch_inference import infer_word_lists
+from streaming import StreamingSession
+
+
+def test_streamed_transformer_matches_batch(tiny_transformer, data, words):
+    model, opt = tiny_transformer
+
+    batched, = infer_word_lists(model, [words], opt, data)
+
+    session = StreamingSession(model, opt, data)
+    streamed = np.concatenate([session.push_words(words), session.flush()])
+
+    # several windows, each of them estimation_motions frames long
+    assert len(batched) > 2 * opt.estimation_motions
+    assert len(batched) % opt.estimation_motions == 0
+    assert streamed.shape == batched.shape
+    np.testing.assert_allclose(streamed, batched, atol=1e-5)
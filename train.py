@@ -1,4 +1,5 @@
 import argparse
+import copy
 import torch
 import time
 import torch.nn.functional as F
@@ -10,8 +11,12 @@ from torch import optim
 from tqdm import tqdm
 from dataset import TedDataset, collate_fn
 from functools import partial
-from transformer.models import Transformer
+from cli import str2bool
+from transformer.models import Transformer, get_pad_mask
 from seq2pose.models import Seq2Pose
+from embedding import strip_embedding, fill_embedding
+from metrics_log import MetricsLog
+from validation import AsyncValidator, snapshot
 
 # from torch2trt import torch2trt
 
@@ -42,11 +47,36 @@ def cust_loss(output, target, alpha, beta):
     return loss
 
 
-def train(model, training_data, validation_data, optim, device, opt, start_i=0):
+def model_predict(model, opt, src_seq, src_len, tgt_seq):
+    '''
+    motion predicted the way inference() runs the model, no ground truth is fed
+    to the decoder apart from the pre motion of seq2pos
+
+    return:
+        [batch x estimation_motions x dim] estimated frames, the same frames
+        the forward pass of the model predicts
+    '''
+    if isinstance(model, Transformer):
+        # the decoder starts from zero motion as in inference_batch()
+        input_mask = get_pad_mask(src_seq, model.src_pad_idx)
+        enc_output, *_ = model.encoder(src_seq, input_mask)
+        enc_output = model.pad_linear(enc_output)
+        dec_output, *_ = model.decoder(torch.zeros_like(tgt_seq, dtype=torch.float), None,
+                                       enc_output, input_mask)
+        return dec_output[:, -opt.estimation_motions:].float()
+
+    # the frames Seq2Pose.forward predicts, starting with the step fed the last pre motion frame
+    motion, _ = model.generate(src_seq.transpose(0, 1), src_len, tgt_seq.transpose(0, 1),
+                               opt.pre_motions, opt.estimation_motions, include_seed_step=True)
+    return motion.transpose(0, 1)
+
+
+def train(model, training_data, validation_data, optim, device, opt, start_i=0, teacher=None, teacher_opt=None):
     ''' Start traning '''
 
     log_train_file = None
     log_valid_file = None
+    metrics = None
 
     if opt.log:
         log_train_file = opt.log + '{}_train.log'.format(opt.model)
@@ -59,31 +89,88 @@ def train(model, training_data, validation_data, optim, device, opt, start_i=0):
                 log_tf.write('epoch,loss\n')
                 log_vf.write('epoch,loss\n')
 
+        # per step and per epoch records, see metrics_log.py for the live viewer
+        metrics = MetricsLog(opt.log + '{}_metrics.ndjson'.format(opt.model))
+
+    # settings of older checkpoints have no validation options
+    valid_mode = getattr(opt, 'valid_mode', 'sync')
+    valid_interval = getattr(opt, 'valid_interval', 1)
+    validator = None
+    if valid_mode == 'async':
+        print('[INFO] validation runs in the background on: {}'.format(opt.valid_device))
+        validator = AsyncValidator(opt, opt.valid_device, opt.valid_threads)
+
     valid_loss_list = []
     train_loss_list = []
+    # checkpoints waiting for their validation result (save_mode best_valid)
+    pending = {}
+
+    def record_valid(epoch, valid_loss, valid_elapse, checkpoint):
+        print('\t- (Validation) epoch: {epoch}, loss: {loss: 8.5f}, elapse: {elapse:3.3f}'.format(
+                                    epoch=epoch, loss=valid_loss, elapse=valid_elapse/60))
+        valid_loss_list.append(valid_loss)
+
+        if opt.save_model and opt.save_mode == 'best_valid' and valid_loss <= min(valid_loss_list):
+            torch.save(checkpoint, opt.save_model + '.chkpt')
+            print('\t[INFO] The checkpoint file has been updated (epoch {}).'.format(epoch))
+
+        if log_valid_file:
+            with open(log_valid_file, 'a') as log_vf:
+                log_vf.write('{epoch},{loss: 8.5f}\n'.format(epoch=epoch, loss=valid_loss))
+
     for epoch_i in range(start_i, opt.epoch):
         print('[ Epoch: {} ]'.format(epoch_i))
+        if metrics:
+            metrics.start_epoch(epoch_i)
 
         start = time.time()
-        train_loss = train_epoch(model, training_data, optim, device, opt)
+        train_loss = train_epoch(model, training_data, optim, device, opt,
+                                 teacher=teacher, teacher_opt=teacher_opt, metrics=metrics)
+        train_elapse = time.time() - start
         print('\t- (Training)   loss: {loss: 8.5f}, elapse: {elapse:3.3f}'.format(
-                                    loss=train_loss, elapse=(time.time()-start)/60))
+                                    loss=train_loss, elapse=train_elapse/60))
         train_loss_list += [train_loss] 
 
-        start = time.time()
-        valid_loss = eval_epoch(model, validation_data, device, opt)
-        print('\t- (Validation)   loss: {loss: 8.5f}, elapse: {elapse:3.3f}'.format(
-                                    loss=valid_loss, elapse=(time.time()-start)/60))
-        valid_loss_list += [valid_loss]
-
         # define parameter to save trained model
         model_state_dict = model.state_dict()
+        share_emb = getattr(opt, 'share_emb', False)
+        if share_emb:
+            # the frozen embedding is loaded from the data file instead
+            model_state_dict = strip_embedding(model_state_dict)
         checkpoint = {
             'model': model_state_dict,
             'settings': opt,
-            'epoch': epoch_i
+            'epoch': epoch_i,
+            'shared_emb': share_emb
         }
 
+        validate = (epoch_i + 1) % valid_interval == 0 or epoch_i == opt.epoch - 1
+        if validate and validator:
+            # the weights keep changing, the validator and the pending checkpoint get a copy
+            checkpoint = dict(checkpoint, model=snapshot(model_state_dict))
+            if validator.submit(epoch_i, checkpoint['model']):
+                pending[epoch_i] = checkpoint
+            else:
+                print('\t[INFO] validation is still busy, epoch {} is not validated.'.format(epoch_i))
+            if metrics:
+                metrics.log_epoch(train_loss=train_loss, train_elapse=train_elapse)
+        elif validate:
+            start = time.time()
+            valid_loss = eval_epoch(model, validation_data, device, opt)
+            valid_elapse = time.time() - start
+            record_valid(epoch_i, valid_loss, valid_elapse, checkpoint)
+            if metrics:
+                metrics.log_epoch(train_loss=train_loss, valid_loss=valid_loss,
+                                  train_elapse=train_elapse, valid_elapse=valid_elapse)
+        elif metrics:
+            metrics.log_epoch(train_loss=train_loss, train_elapse=train_elapse)
+
+        if validator:
+            for epoch, valid_loss, valid_elapse in validator.poll():
+                record_valid(epoch, valid_loss, valid_elapse, pending.pop(epoch))
+                if metrics:
+                    metrics.log_valid(epoch, valid_loss=valid_loss, valid_elapse=valid_elapse)
+
         if opt.save_model:
             if opt.save_mode == 'all':
                 model_name = opt.save_model + '_tr_loss_{epoch}_{train_loss: 3.3f}.chkpt'.format(
@@ -103,20 +190,28 @@ def train(model, training_data, validation_data, optim, device, opt, start_i=0):
                     torch.save(checkpoint, model_name)
                     print('\t[INFO] The checkpoint file has been saved.')
 
-        if log_train_file and log_valid_file:
-            with open(log_train_file, 'a') as log_tf, open(log_valid_file, 'a') as log_vf:
+        if log_train_file:
+            with open(log_train_file, 'a') as log_tf:
                 log_tf.write('{epoch},{loss: 8.5f}\n'.format(
                     epoch=epoch_i, loss=train_loss))
-                log_vf.write('{epoch},{loss: 8.5f}\n'.format(
-                    epoch=epoch_i, loss=valid_loss))
+
+    if validator:
+        for epoch, valid_loss, valid_elapse in validator.close():
+            record_valid(epoch, valid_loss, valid_elapse, pending.pop(epoch))
+            if metrics:
+                metrics.log_valid(epoch, valid_loss=valid_loss, valid_elapse=valid_elapse)
+
+    if metrics:
+        metrics.close()
 
 
-def eval_epoch(model, validation_data, device, opt):
+def eval_epoch(model, validation_data, device, opt, progress=True):
     model.eval()
 
     total_loss = 0
     with torch.no_grad():
-        for batch in tqdm(validation_data, mininterval=2, desc=' - (Validation)', leave=False):
+        for batch in tqdm(validation_data, mininterval=2, desc=' - (Validation)', leave=False,
+                          disable=not progress):
             batch_loss = 0
             n_motion = 0
             for src_seq, src_len, tgt_seq in batch:
@@ -140,7 +235,7 @@ def eval_epoch(model, validation_data, device, opt):
         return total_loss
 
 
-def train_epoch(model, training_data, optim, device, opt):
+def train_epoch(model, training_data, optim, device, opt, teacher=None, teacher_opt=None, metrics=None):
     model.train()
 
     total_loss = 0
@@ -157,11 +252,17 @@ def train_epoch(model, training_data, optim, device, opt):
             if opt.model == "transformer": # todo
                 pred, ans = model(opt, src_seq, tgt_seq, device)
                 loss = cust_loss(pred, ans, opt.alpha, opt.beta)
-                loss.backward()
             elif opt.model == 'seq2pos':
                 pred, ans = model(opt, src_seq, src_len, tgt_seq, device)
                 loss = cust_loss(pred, ans, opt.alpha, opt.beta)
-                loss.backward()
+
+            if teacher is not None:
+                # follow the motion the teacher predicts at inference as well as the ground truth
+                with torch.no_grad():
+                    teacher_pred = model_predict(teacher, teacher_opt, src_seq, src_len, tgt_seq)
+                loss = loss + opt.distill_weight * F.mse_loss(pred, teacher_pred)
+
+            loss.backward()
 
             # optimize
             optim.step()
@@ -169,11 +270,120 @@ def train_epoch(model, training_data, optim, device, opt):
             batch_loss += loss.item()
             n_motion += 1
 
+            if metrics:
+                metrics.log_step(loss=loss.item())
+
         total_loss += batch_loss/n_motion
     
     return total_loss
 
 
+def load_teacher(opt, data, device):
+    '''
+    return:
+        frozen teacher model, settings of its checkpoint to run it with
+
+    note:
+        the teacher sees the windows of the student batches, so both have to
+        be trained on the same pre / estimation motion lengths
+    '''
+    print('[INFO] load teacher model from: {}'.format(opt.teacher))
+    teacher_info = torch.load(opt.teacher, map_location=device)
+    teacher_opt = copy.copy(teacher_info['settings'])
+    for key in ('pre_motions', 'estimation_motions'):
+        if getattr(teacher_opt, key) != getattr(opt, key):
+            raise ValueError('teacher was trained with {} {}, the student uses {}'.format(
+                                        key, getattr(teacher_opt, key), getattr(opt, key)))
+
+    teacher = build_model(teacher_opt, data, device)
+    teacher.load_state_dict(fill_embedding(teacher_info['model'], teacher))
+    teacher.eval()
+    # the teacher is never updated
+    for p in teacher.parameters():
+        p.requires_grad = False
+
+    return teacher, teacher_opt
+
+
+def report_distillation(student, teacher, validation_data, device, opt, teacher_opt):
+    '''
+    compare the student against the teacher on the validation set, both
+    models run as in inference (model_predict)
+
+    return:
+        mean squared error between student and teacher motion (pca space),
+        teacher elapse / student elapse
+    '''
+    student.eval()
+    teacher.eval()
+
+    sq_err = 0
+    n_motion = 0
+    elapse = {'student': 0, 'teacher': 0}
+    with torch.no_grad():
+        for batch in validation_data:
+            for src_seq, src_len, tgt_seq in batch:
+                src_seq = src_seq.to(device)
+                tgt_seq = tgt_seq.to(device)
+
+                preds = {}
+                for name, model, model_opt in (('student', student, opt), ('teacher', teacher, teacher_opt)):
+                    if device.type == 'cuda':
+                        torch.cuda.synchronize()
+                    start = time.time()
+                    preds[name] = model_predict(model, model_opt, src_seq, src_len, tgt_seq)
+                    if device.type == 'cuda':
+                        torch.cuda.synchronize()
+                    elapse[name] += time.time() - start
+
+                sq_err += F.mse_loss(preds['student'], preds['teacher']).item()
+                n_motion += 1
+
+    mse = sq_err / n_motion
+    speedup = elapse['teacher'] / elapse['student']
+    n_params = lambda m: sum(p.numel() for p in m.parameters())
+    print('[INFO] Distillation report')
+    print('\t- parameters: teacher {}, student {}'.format(n_params(teacher), n_params(student)))
+    print('\t- speedup: x{:.2f} (teacher {:.3f}s, student {:.3f}s)'.format(
+                                speedup, elapse['teacher'], elapse['student']))
+    print('\t- motion mse vs teacher: {:.6f}'.format(mse))
+
+    return mse, speedup
+
+
+def build_model(opt, data, device):
+    if opt.model == 'transformer':
+        print('[INFO] transformer model selected.')
+        model = Transformer(
+            emb_matrix=data['emb_tbl'],
+            n_src_vocab=opt.scr_vocab_size,
+            src_pad_idx = opt.src_pad_idx,
+            trg_pad_idx = opt.trg_pad_idx,
+            d_enc_model=opt.d_enc_model,
+            d_dec_model=opt.d_dec_model,
+            d_inner=opt.d_inner_hid,
+            n_layers=opt.n_layers,
+            d_k=opt.d_k,
+            d_v=opt.d_v,
+            n_head=opt.n_head,
+            dropout=opt.dropout).to(device)
+    elif opt.model == 'seq2pos':
+        print('[INFO] seq2pos model selected.')
+        model = Seq2Pose(
+            word_emb=data['emb_tbl'],
+            batch_size=opt.batch_size,
+            hidden_size=opt.hidden_size,
+            n_enc_layers=opt.n_enc_layers,
+            n_dec_layers=opt.n_dec_layers,
+            bidirectional=opt.bidirectional,
+            dropout=opt.dropout,
+            out_dim=data['pca'].n_components).to(device)
+    else:
+        print("[ERROR] undefined model.")
+
+    return model
+
+
 def main():
     parser = argparse.ArgumentParser()
 
@@ -186,7 +396,7 @@ def main():
     parser.add_argument('-model', default='transformer')
     # parser.add_argument('-model', default='seq2pos')
     parser.add_argument('-save_model', default='./trained_model/transformer')
-    parser.add_argument('-save_mode', default='best')
+    parser.add_argument('-save_mode', default='best') # all, best, best_valid or interval
     parser.add_argument('-save_interval', type=int, default=10)
     parser.add_argument('-log', default="./log/")
     parser.add_argument('-lr', type=int, default=0.000001)
@@ -197,6 +407,11 @@ def main():
     parser.add_argument('-estimation_motions', type=int, default=20)
     parser.add_argument('-frame_duration', type=int, default=1/12)
     parser.add_argument('-speech_sp', type=int, default=2.5) # assume speech speed is 2.5 wps  
+    parser.add_argument('-share_emb', type=str2bool, default=False) # keep the embedding only in the data file
+    parser.add_argument('-valid_mode', default='sync') # sync or async (background process)
+    parser.add_argument('-valid_interval', type=int, default=1) # validate every n epochs
+    parser.add_argument('-valid_device', default='cpu') # device of the async validation process
+    parser.add_argument('-valid_threads', type=int, default=1)
     
     # seq2pos args
     parser.add_argument('-hidden_size', type=int, default=200)
@@ -214,6 +429,10 @@ def main():
     parser.add_argument('-d_v', type=int, default=50)
     parser.add_argument('-n_head', type=int, default=6)
     parser.add_argument('-n_position', type=int, default=10)
+
+    # distillation args
+    parser.add_argument('-teacher', default=None)
+    parser.add_argument('-distill_weight', type=float, default=1.0)
     
     opt = parser.parse_args()
 
@@ -245,77 +464,31 @@ def main():
         ############################################
         #               Prepare Model              #
         ############################################
-        if opt.model == 'transformer':
-            print('[INFO] transformer model selected.')
-            model = Transformer(
-                emb_matrix=data['emb_tbl'],
-                n_src_vocab=opt.scr_vocab_size,
-                src_pad_idx = opt.src_pad_idx,
-                trg_pad_idx = opt.trg_pad_idx,
-                d_enc_model=opt.d_enc_model,
-                d_dec_model=opt.d_dec_model,
-                d_inner=opt.d_inner_hid,
-                n_layers=opt.n_layers,
-                d_k=opt.d_k,
-                d_v=opt.d_v,
-                n_head=opt.n_head,
-                dropout=opt.dropout).to(device)
-        elif opt.model == 'seq2pos':
-            print('[INFO] seq2pos model selected.')
-            model = Seq2Pose(
-                word_emb=data['emb_tbl'],
-                batch_size=opt.batch_size,
-                hidden_size=opt.hidden_size,
-                n_enc_layers=opt.n_enc_layers,
-                n_dec_layers=opt.n_dec_layers,
-                bidirectional=opt.bidirectional,
-                dropout=opt.dropout,
-                out_dim=data['pca'].n_components).to(device)
-        else:
-            print("[ERROR] undefined model.")
+        model = build_model(opt, data, device)
         print('[INFO] load state dict')
-        model.load_state_dict(state)
-
-        # optimizer
-        optimizer = optim.Adam(model.parameters(), lr=opt.lr)
-        train(model, training_data, validation_data, optimizer, device, opt, start_i=start_i+1)
+        model.load_state_dict(fill_embedding(state, model))
+        start_i += 1
 
     else:
         ############################################
         #               Prepare Model              #
         ############################################
-        if opt.model == 'transformer':
-            print('[INFO] transformer model selected.')
-            model = Transformer(
-                emb_matrix=data['emb_tbl'],
-                n_src_vocab=opt.scr_vocab_size,
-                trg_pad_idx=opt.trg_pad_idx,
-                src_pad_idx = opt.src_pad_idx,
-                d_enc_model=opt.d_enc_model,
-                d_dec_model=opt.d_dec_model,
-                d_inner=opt.d_inner_hid,
-                n_layers=opt.n_layers,
-                d_k=opt.d_k,
-                d_v=opt.d_v,
-                n_head=opt.n_head,
-                dropout=opt.dropout).to(device)
-        elif opt.model == 'seq2pos':
-            print('[INFO] seq2pos model selected.')
-            model = Seq2Pose(
-                word_emb=data['emb_tbl'],
-                batch_size=opt.batch_size,
-                hidden_size=opt.hidden_size,
-                n_enc_layers=opt.n_enc_layers,
-                n_dec_layers=opt.n_dec_layers,
-                bidirectional=opt.bidirectional,
-                dropout=opt.dropout,
-                out_dim=data['pca'].n_components).to(device)
-        else:
-            print("[ERROR] undefined model.")
-
-        # optimizer
-        optimizer = optim.Adam(model.parameters(), lr=opt.lr)
-        train(model, training_data, validation_data, optimizer, device, opt)
+        model = build_model(opt, data, device)
+        start_i = 0
+
+    teacher, teacher_opt = None, None
+    if getattr(opt, 'teacher', None):
+        if opt.save_model and os.path.abspath(opt.save_model + '.chkpt') == os.path.abspath(opt.teacher):
+            parser.error('-save_model would overwrite the teacher checkpoint: {}'.format(opt.teacher))
+        teacher, teacher_opt = load_teacher(opt, data, device)
+
+    # optimizer
+    optimizer = optim.Adam(model.parameters(), lr=opt.lr)
+    train(model, training_data, validation_data, optimizer, device, opt, start_i=start_i,
+          teacher=teacher, teacher_opt=teacher_opt)
+
+    if teacher is not None:
+        report_distillation(model, teacher, validation_data, device, opt, teacher_opt)
 
     ############################################
     #            Prepare Dataloader            #
@@ -332,18 +505,22 @@ def prepare_dataloaders(data, opt):
             collate_fn=partial(collate_fn, opt=opt),
             shuffle=True)
 
-    valid_loader = torch.utils.data.DataLoader(
+    valid_loader = prepare_valid_loader(data, opt, opt.n_workers)
+
+    return train_loader, valid_loader
+
+
+def prepare_valid_loader(data, opt, n_workers):
+    return torch.utils.data.DataLoader(
         TedDataset(
             src_word2idx=data['dict'],
             src_insts=data['valid']['src'],
             tgt_insts=data['valid']['tgt']
             ),
-            num_workers=opt.n_workers,
+            num_workers=n_workers,
             batch_size=opt.batch_size,
             collate_fn=partial(collate_fn, opt=opt))
 
-    return train_loader, valid_loader
-
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,10 +1,10 @@
 import torch
 import torch.nn as nn
 import numpy as np
-import matplotlib.pyplot as plt
 import constant as Constants
 import random
 
+from embedding import emb_tensor
 from transformer.layers import EncoderLayer, DecoderLayer
 
 
@@ -69,7 +69,7 @@ class Encoder(nn.Module):
         super().__init__()
 
         # self.src_word_emb = nn.Embedding(n_src_vocab, d_word_vec, padding_idx=Constants.PAD)
-        emb_matrix = torch.from_numpy(emb_matrix).float()
+        emb_matrix = emb_tensor(emb_matrix)
         self.src_word_emb = nn.Embedding.from_pretrained(emb_matrix, freeze=True)
         self.postion_enc = PositionalEncoding(d_word_vec, n_position=n_position)
         self.dropout = nn.Dropout(p=dropout)
@@ -82,7 +82,7 @@ class Encoder(nn.Module):
         enc_slf_attn_list = []
 
         # forward
-        enc_output = self.dropout(self.postion_enc(self.src_word_emb(src_seq)))
+        enc_output = self.dropout(self.postion_enc(self.src_word_emb(src_seq).float()))
         
         for enc_layer in self.layer_stack:
             enc_output, enc_slf_attn = enc_layer(enc_output, slf_attn_mask=src_mask)
@@ -153,8 +153,9 @@ class Transformer(nn.Module):
                 n_layers=n_layers, n_head=n_head, d_dec_model=d_dec_model, 
                 d_inner=d_inner, dropout=dropout)
 
+        # the frozen pretrained embedding keeps its vectors
         for p in self.parameters():
-            if p.dim() > 1:
+            if p.dim() > 1 and p.requires_grad:
                 nn.init.xavier_uniform_(p)
 
     def forward(self, opt, src_seq, trg_seq, device):
@@ -1,4 +1,5 @@
 import numpy as np
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -14,13 +15,13 @@ class MultiHeadAttention(nn.Module):
         self.d_v = d_v
 
         self.w_qs = nn.Linear(d_model, n_head * d_k)
-        self.w_ks = nn.Linear(d_model, n_head * d_k)
-        self.w_vs = nn.Linear(d_model, n_head * d_v)
+        # key and value projections packed in one layer, [w_ks; w_vs]
+        self.w_kvs = nn.Linear(d_model, n_head * (d_k + d_v))
 
         # initialize initial weight
         nn.init.normal_(self.w_qs.weight, mean=0, std=np.sqrt(2.0 / (d_model + d_k)))
-        nn.init.normal_(self.w_ks.weight, mean=0, std=np.sqrt(2.0 / (d_model + d_k)))
-        nn.init.normal_(self.w_vs.weight, mean=0, std=np.sqrt(2.0 / (d_model + d_v)))
+        nn.init.normal_(self.w_kvs.weight[:n_head * d_k], mean=0, std=np.sqrt(2.0 / (d_model + d_k)))
+        nn.init.normal_(self.w_kvs.weight[n_head * d_k:], mean=0, std=np.sqrt(2.0 / (d_model + d_v)))
 
         self.attention = ScaledDotProductAttention(temperature=np.power(d_k, 0.5)) # root d_k
         self.layer_norm = nn.LayerNorm(d_model)
@@ -31,7 +32,15 @@ class MultiHeadAttention(nn.Module):
         # dropout layer
         self.dropout = nn.Dropout(dropout)
 
-    
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints saved before packing have separate w_ks and w_vs layers
+        for name in ('weight', 'bias'):
+            k_key, v_key = prefix + 'w_ks.' + name, prefix + 'w_vs.' + name
+            if k_key in state_dict and v_key in state_dict:
+                state_dict[prefix + 'w_kvs.' + name] = torch.cat(
+                                        (state_dict.pop(k_key), state_dict.pop(v_key)), 0)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, q, k, v, mask=None):
         d_k, d_v, n_head = self.d_k, self.d_v, self.n_head
         sz_b, len_q, len_k, len_v = q.size(0), q.size(1), k.size(1), v.size(1)
@@ -41,8 +50,21 @@ class MultiHeadAttention(nn.Module):
 
         # forwrard and reshpae tensor
         q = self.w_qs(q).view(sz_b, len_q, n_head, d_k)
-        k = self.w_ks(k).view(sz_b, len_k, n_head, d_k)
-        v = self.w_vs(v).view(sz_b, len_v, n_head, d_v)
+        if k is v:
+            # one packed projection, split into views without copying
+            k, v = self.w_kvs(k).split([n_head * d_k, n_head * d_v], dim=-1)
+        elif isinstance(self.w_kvs, nn.Linear):
+            # only the key rows for k and the value rows for v
+            n_k = n_head * d_k
+            weight, bias = self.w_kvs.weight, self.w_kvs.bias
+            k = F.linear(k, weight[:n_k], bias[:n_k])
+            v = F.linear(v, weight[n_k:], bias[n_k:])
+        else:
+            # dynamic int8 layers (quantize.py) keep their packed weight
+            k = self.w_kvs(k)[..., :n_head * d_k]
+            v = self.w_kvs(v)[..., n_head * d_k:]
+        k = k.view(sz_b, len_k, n_head, d_k)
+        v = v.view(sz_b, len_v, n_head, d_v)
         q, k, v = q.transpose(1,2), k.transpose(1,2), v.transpose(1,2)
 
         if mask is not None:
@@ -50,8 +72,8 @@ class MultiHeadAttention(nn.Module):
         
         output, attn = self.attention(q, k, v, mask=mask)
 
-        output = output.view(n_head, sz_b, len_q, d_v)
-        output = output.permute(1, 2, 0, 3).contiguous().view(sz_b, len_q, -1)
+        # b x n_head x lq x dv -> b x lq x (n_head * dv), batch entries must not mix
+        output = output.transpose(1, 2).contiguous().view(sz_b, len_q, -1)
         output = self.dropout(self.fc(output))
         output += residual
 
@@ -0,0 +1,128 @@
+import copy
+import queue
+import time
+import traceback
+import torch
+import torch.multiprocessing as mp
+
+
+def snapshot(state_dict):
+    ''' cpu copy of the weights, training keeps updating the original tensors '''
+    return {k: v.detach().to('cpu', copy=True) for k, v in state_dict.items()}
+
+
+def _worker(opt, device, n_threads, task_queue, result_queue):
+    # imported here, train.py imports this module
+    from train import build_model, eval_epoch, prepare_valid_loader
+    from embedding import fill_embedding
+
+    try:
+        torch.set_num_threads(n_threads)
+        device = torch.device(device)
+        data = torch.load(opt.data)
+        opt.trg_pad_idx = opt.trg_pad_idx.to(device)
+        # no loader workers of its own, they would take cores from training
+        validation_data = prepare_valid_loader(data, opt, n_workers=0)
+        model = build_model(opt, data, device)
+    except Exception:
+        result_queue.put(('error', None, traceback.format_exc()))
+        return
+    result_queue.put(('ready', None, None))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        epoch, state = task
+        try:
+            start = time.time()
+            model.load_state_dict(fill_embedding(state, model))
+            loss = eval_epoch(model, validation_data, device, opt, progress=False)
+            result_queue.put(('done', epoch, (loss, time.time() - start)))
+        except Exception:
+            result_queue.put(('failed', epoch, traceback.format_exc()))
+
+
+class AsyncValidator():
+    '''
+    run eval_epoch on weight snapshots in a background process
+
+    param:
+        device - device of the validation process, the cpu by default so a gpu
+                 training run keeps the gpu to itself
+        n_threads - intra-op threads of the validation process
+        max_pending - snapshots waiting for validation, epochs that come while
+                      the queue is full are not validated instead of stalling training
+    note:
+        the process loads the data file and builds its own model and loader once,
+        every submit only sends the state dict
+    '''
+
+    def __init__(self, opt, device='cpu', n_threads=1, max_pending=1):
+        opt = copy.copy(opt)
+        opt.trg_pad_idx = opt.trg_pad_idx.cpu()
+
+        # spawn, forked workers would inherit the thread pools of the parent
+        ctx = mp.get_context('spawn')
+        self.task_queue = ctx.Queue(max_pending)
+        self.result_queue = ctx.Queue()
+        self.process = ctx.Process(target=_worker,
+                                   args=(opt, str(device), n_threads, self.task_queue, self.result_queue),
+                                   daemon=True)
+        self.process.start()
+        self.n_pending = 0
+
+        status, _, message = self._get()
+        if status == 'error':
+            self.process.join()
+            raise RuntimeError('validation process failed to start:\n{}'.format(message))
+
+    def submit(self, epoch, state_dict):
+        '''
+        param:
+            state_dict - a snapshot() of the weights, it is sent as it is
+        return:
+            False when the validator is busy and the epoch is skipped
+        '''
+        try:
+            self.task_queue.put_nowait((epoch, state_dict))
+        except queue.Full:
+            return False
+        self.n_pending += 1
+        return True
+
+    def _get(self, poll=1.0):
+        # a process that died (out of memory, crash) never answers, do not wait forever
+        while True:
+            try:
+                return self.result_queue.get(timeout=poll)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError('validation process exited with code {}'.format(
+                                                                    self.process.exitcode))
+
+    def _result(self, block):
+        status, epoch, result = self._get() if block else self.result_queue.get(False)
+        self.n_pending -= 1
+        if status == 'failed':
+            raise RuntimeError('validation of epoch {} failed:\n{}'.format(epoch, result))
+        return (epoch,) + result
+
+    def poll(self):
+        ''' return: list of (epoch, valid loss, seconds) that finished since the last call '''
+        results = []
+        while self.n_pending > 0:
+            try:
+                results.append(self._result(block=False))
+            except queue.Empty:
+                break
+        return results
+
+    def close(self):
+        ''' wait for the pending validations and stop the process, return their results '''
+        results = [self._result(block=True) for _ in range(self.n_pending)]
+        self.task_queue.put(None)
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.terminate()
+        return results